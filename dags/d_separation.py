@@ -0,0 +1,99 @@
+"""A d-separation engine that answers repeated queries against a single causal DAG."""
+import networkx as nx
+from typing import Iterable
+
+
+class DSeparationEngine:
+    """Answer d-separation queries for a fixed causal DAG from precomputed bitsets.
+
+    Each node is assigned an integer position in a topological order of the DAG. The ancestors (including the node
+    itself), parents, and children of every node are then stored as integer bitsets, which are computed once when the
+    engine is constructed. A d-separation query is answered by the following graph surgery:
+
+    1. Take the ancestral set of X, Y, and Z (the union of their ancestor bitsets).
+    2. Remove all edges leaving a node in Z.
+    3. X and Y are d-separated by Z iff no node in Y is reachable from X in the resulting (undirected) graph.
+
+    This matches the semantics of networkx's d-separation check, including the case where a node of X or Y also
+    appears in Z, but avoids rebuilding the ancestral graph for every query.
+
+    :param dag: A networkx directed graph representing a causal DAG.
+    """
+
+    def __init__(self, dag: nx.DiGraph):
+        assert nx.is_directed_acyclic_graph(dag), "Error: Graph is not a DAG."
+        self.nodes = list(nx.topological_sort(dag))
+        self.positions = {node: position for position, node in enumerate(self.nodes)}
+        self.parents = {node: frozenset(dag.predecessors(node)) for node in self.nodes}
+        self.parent_masks = []
+        self.child_masks = []
+        self.ancestor_masks = []
+
+        for node in self.nodes:
+            parent_mask = self.to_mask(self.parents[node])
+            self.parent_masks.append(parent_mask)
+            self.child_masks.append(self.to_mask(dag.successors(node)))
+
+            # Parents precede their children in topological order, so their ancestor bitsets are already known
+            ancestor_mask = 1 << self.positions[node]
+            for parent in self.parents[node]:
+                ancestor_mask |= self.ancestor_masks[self.positions[parent]]
+            self.ancestor_masks.append(ancestor_mask)
+
+    def to_mask(self, nodes: Iterable) -> int:
+        """Convert a collection of nodes to a bitset.
+
+        :param nodes: An iterable of nodes in the DAG.
+        :return: An integer whose set bits correspond to the topological positions of the nodes.
+        """
+        mask = 0
+        for node in nodes:
+            mask |= 1 << self.positions[node]
+        return mask
+
+    def adjustment_set(self, cause, effect) -> set:
+        """Get the set of variables to adjust for when isolating the relationship between a pair of nodes.
+
+        :param cause: A node in the DAG.
+        :param effect: A node in the DAG.
+        :return: The union of the parents of the cause and the effect.
+        """
+        return set(self.parents[cause] | self.parents[effect])
+
+    def d_separated(self, x: Iterable, y: Iterable, z: Iterable) -> bool:
+        """Check whether the nodes in x and y are d-separated by the nodes in z.
+
+        :param x: An iterable of nodes in the DAG.
+        :param y: An iterable of nodes in the DAG.
+        :param z: An iterable of nodes in the DAG to condition on.
+        :return: True if x and y are d-separated by z, False otherwise.
+        """
+        x_mask = self.to_mask(x)
+        y_mask = self.to_mask(y)
+        z_mask = self.to_mask(z)
+
+        ancestral_mask = 0
+        remaining = x_mask | y_mask | z_mask
+        while remaining:
+            lowest_bit = remaining & -remaining
+            ancestral_mask |= self.ancestor_masks[lowest_bit.bit_length() - 1]
+            remaining ^= lowest_bit
+
+        # Traverse the ancestral graph from x, ignoring any edge that leaves a node in z
+        reached = x_mask
+        frontier = x_mask
+        while frontier:
+            if frontier & y_mask:
+                return False
+            neighbours = 0
+            while frontier:
+                lowest_bit = frontier & -frontier
+                position = lowest_bit.bit_length() - 1
+                if not lowest_bit & z_mask:
+                    neighbours |= self.child_masks[position]
+                neighbours |= self.parent_masks[position] & ~z_mask
+                frontier ^= lowest_bit
+            frontier = neighbours & ancestral_mask & ~reached
+            reached |= frontier
+
+        return True
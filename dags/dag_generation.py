@@ -1,16 +1,82 @@
 import networkx as nx
+import numpy as np
 import random
-from networkx.exception import NetworkXError
+from collections import namedtuple
+from typing import List
 from dags.dag_utils import (
     get_non_causal_node_pairs,
     get_exogenous_nodes,
     structural_hamming_distance,
-    to_dot
+    adjacency_structural_hamming_distance,
+    save_dag
 )
+from dags.dag_index import CausalDAGIndex
+from helpers import unrank_pairs
+
+
+class SampledDAG(namedtuple("SampledDAG", ["nodes", "causes", "effects"])):
+    """A causal DAG sampled by sample_dag, stored as arrays of node ids.
+
+    :param nodes: The names of the nodes, indexed by node id. Node ids are a topological order of the DAG.
+    :param causes: The id of the cause of each edge.
+    :param effects: The id of the effect of each edge.
+    """
+
+    __slots__ = ()
+
+    def to_networkx(self) -> nx.DiGraph:
+        """Build the networkx directed graph of the DAG, whose nodes are added in order of their ids.
+
+        :return: A networkx directed graph representing the causal DAG.
+        """
+        nodes = np.array(self.nodes, dtype=object)
+        causal_dag = nx.DiGraph()
+        causal_dag.add_nodes_from(self.nodes)
+        causal_dag.add_edges_from(zip(nodes[self.causes], nodes[self.effects]))
+        return causal_dag
+
+
+def sample_dag(n_nodes: int, p_edge: float, seed: int = None) -> SampledDAG:
+    """Sample a random DAG with NumPy, without building a networkx graph.
+
+    The DAG has the same distribution as that of generate_dag: each pair of nodes (i, j), where i < j, is joined by the
+    edge i --> j with probability p_edge, and the nodes without parents (inputs) and with parents (outputs) are labelled
+    X1, X2, ... and Y1, Y2, ... in ascending numerical order. Rather than drawing a Bernoulli variable for every pair,
+    the gaps between consecutive edges in the order of itertools.combinations are drawn from a geometric distribution,
+    so the time and memory used are proportional to the number of edges.
+
+    :param n_nodes: The number of nodes the DAG should contain.
+    :param p_edge: The probability of edge creation.
+    :param seed: An optional random seed.
+    :return: The SampledDAG.
+    """
+    rng = np.random.default_rng(seed)
+    n_pairs = n_nodes * (n_nodes - 1) // 2
+    edge_ranks = []
+    if p_edge > 0:
+        last_rank = -1
+        while last_rank < n_pairs - 1:
+            # Draw enough gaps to reach the last pair with high probability
+            expected_edges = (n_pairs - 1 - last_rank) * p_edge
+            gaps = rng.geometric(min(p_edge, 1), size=int(expected_edges + 4 * np.sqrt(expected_edges)) + 1)
+            ranks = last_rank + np.cumsum(gaps)
+            edge_ranks.append(ranks[ranks < n_pairs])
+            last_rank = ranks[-1]
+    edges = unrank_pairs(np.concatenate(edge_ranks) if edge_ranks else np.empty(0, dtype=np.int64), n_nodes)
+    causes, effects = edges[:, 0], edges[:, 1]
+
+    # Label the nodes without parents as inputs and the rest as outputs
+    is_input = np.bincount(effects, minlength=n_nodes) == 0
+    input_numbers = np.cumsum(is_input)
+    output_numbers = np.cumsum(~is_input)
+    nodes = [f"X{input_number}" if node_is_input else f"Y{output_number}" for node_is_input, input_number, output_number
+             in zip(is_input.tolist(), input_numbers.tolist(), output_numbers.tolist())]
+    return SampledDAG(nodes, causes, effects)
 
 
 def generate_dag(
-    n_nodes: int, p_edge: float, p_conditional: float, seed: int = None, dot_path: str = None
+    n_nodes: int, p_edge: float, p_conditional: float, seed: int = None, dot_path: str = None,
+    sampler: str = "networkx"
 ) -> nx.DiGraph:
     """Generate a random DAG with a specified number of nodes and edges.
 
@@ -37,9 +103,17 @@ def generate_dag(
     :param p_edge: The probability of edge creation.
     :param p_conditional: Probability of a node being made conditional.
     :param seed: An optional random seed.
-    :param dot_path: An optional path to save a DOT file.
+    :param dot_path: An optional path to save a DOT file (and a binary DAG file alongside it, see save_dag).
+    :param sampler: Either "networkx", which samples the DAG as described above, or "numpy", which samples a DAG from
+                    the same distribution with sample_dag. The two samplers draw different DAGs for the same seed.
     return: A string containing a DOT causal DAG.
     """
+    if sampler == "numpy":
+        input_output_causal_dag = sample_dag(n_nodes, p_edge, seed).to_networkx()
+        if dot_path:
+            save_dag(input_output_causal_dag, dot_path, p_edge=p_edge, p_conditional=p_conditional)
+        return input_output_causal_dag
+
     if seed is not None:
         random.seed(seed)
 
@@ -70,7 +144,7 @@ def generate_dag(
     input_output_causal_dag = nx.relabel_nodes(causal_dag, node_map)
 
     if dot_path:
-        to_dot(input_output_causal_dag, dot_path, p_edge=p_edge, p_conditional=p_conditional)
+        save_dag(input_output_causal_dag, dot_path, p_edge=p_edge, p_conditional=p_conditional)
 
     return input_output_causal_dag
 
@@ -79,7 +153,8 @@ def mutate_dag(
         causal_dag: nx.DiGraph,
         p_invert_edge: float,
         out_path: str = None,
-        seed: int = None
+        seed: int = None,
+        index: CausalDAGIndex = None
 ):
     """Invert potential edges in the causal DAG with a specified probability.
 
@@ -88,31 +163,71 @@ def mutate_dag(
 
     :param causal_dag: A networkx directed graph representing the causal DAG.
     :param p_invert_edge: Probability that an arbitrary edge (or lack thereof)
-    :param out_path: An optional path to save a DOT file.
+    :param out_path: An optional path to save a DOT file (and a binary DAG file alongside it, see save_dag).
     :param seed: Random seed to control non-determinism.
     is inverted.
+    :param index: An optional CausalDAGIndex of the causal DAG, which can be built once and shared between mutations.
     """
-    if seed is not None:
-        random.seed(seed)
-
-    dag_to_mutate = causal_dag.copy()
-    non_causal_node_pairs = get_non_causal_node_pairs(dag_to_mutate)
-    invertible_node_pairs = list(dag_to_mutate.edges) + non_causal_node_pairs
-
-    for node_pair in invertible_node_pairs:
-        if random.random() < p_invert_edge:
-            try:
-                dag_to_mutate.remove_edge(*node_pair)
-            except NetworkXError:
-                dag_to_mutate.add_edge(*node_pair)
+    return mutate_dag_levels(causal_dag, [p_invert_edge], [out_path], seed, index)[0]
 
-    assert nx.is_directed_acyclic_graph(dag_to_mutate)
 
-    if out_path:
-        shd = structural_hamming_distance(causal_dag, dag_to_mutate)
-        to_dot(dag_to_mutate, out_path, p_invert_edge=p_invert_edge, structural_hamming_distance=shd)
+def mutate_dag_levels(
+        causal_dag: nx.DiGraph,
+        p_invert_edges: List[float],
+        out_paths: List[str] = None,
+        seed: int = None,
+        index: CausalDAGIndex = None
+) -> List[nx.DiGraph]:
+    """Invert potential edges in the causal DAG at several levels of misspecification in one pass.
+
+    A single uniform random number is drawn for every invertible pair of nodes (each edge, followed by each pair
+    returned by get_non_causal_node_pairs), and the pair is inverted at every level whose probability exceeds its draw.
+    The misspecified DAGs are therefore nested (every edge inverted at one level is also inverted at the higher
+    levels), and each is identical to the DAG returned by mutate_dag for the same probability and seed. The inversions
+    are applied to the adjacency matrix of the DAG, and the structural hamming distance of each level is counted from
+    the difference between the adjacency matrices.
 
-    return dag_to_mutate
+    :param causal_dag: A networkx directed graph representing the causal DAG.
+    :param p_invert_edges: The probability that an arbitrary edge (or lack thereof) is inverted, for each level.
+    :param out_paths: Optional paths to save the DOT and binary DAG files of each level to (None to not save a level).
+    :param seed: Random seed to control non-determinism.
+    :param index: An optional CausalDAGIndex of the causal DAG.
+    :return: The misspecified DAG of each level.
+    """
+    if seed is not None:
+        random.seed(seed)
+    if index is None:
+        index = CausalDAGIndex(causal_dag)
+    if out_paths is None:
+        out_paths = [None] * len(p_invert_edges)
+
+    edges = list(causal_dag.edges)
+    invertible_node_pairs = edges + get_non_causal_node_pairs(causal_dag, index)
+    draws = np.array([random.random() for _ in invertible_node_pairs])
+    causes = np.array([index.ids[cause] for cause, _ in invertible_node_pairs], dtype=np.int64)
+    effects = np.array([index.ids[effect] for _, effect in invertible_node_pairs], dtype=np.int64)
+
+    mutated_dags = []
+    for p_invert_edge, out_path in zip(p_invert_edges, out_paths):
+        inverted = draws < p_invert_edge
+        mutated_adjacency = index.adjacency.copy()
+        mutated_adjacency[causes[inverted], effects[inverted]] ^= True
+
+        # Inverted edges are removed and inverted non-edges are added, in the order they are inverted by mutate_dag
+        inverted_positions = np.flatnonzero(inverted).tolist()
+        dag_to_mutate = causal_dag.copy()
+        dag_to_mutate.remove_edges_from(invertible_node_pairs[position] for position in inverted_positions
+                                        if position < len(edges))
+        dag_to_mutate.add_edges_from(invertible_node_pairs[position] for position in inverted_positions
+                                     if position >= len(edges))
+        assert nx.is_directed_acyclic_graph(dag_to_mutate)
+
+        if out_path:
+            shd = adjacency_structural_hamming_distance(index.adjacency, mutated_adjacency)
+            save_dag(dag_to_mutate, out_path, p_invert_edge=p_invert_edge, structural_hamming_distance=shd)
+        mutated_dags.append(dag_to_mutate)
+
+    return mutated_dags
 
 
 if __name__ == "__main__":
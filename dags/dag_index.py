@@ -0,0 +1,73 @@
+"""An index of the topology of a causal DAG, built once and shared by the utilities in dags/dag_utils.py."""
+import networkx as nx
+import numpy as np
+
+INPUT_INPUT = 0
+INPUT_OUTPUT = 1
+OUTPUT_INPUT = 2
+OUTPUT_OUTPUT = 3
+
+
+class CausalDAGIndex:
+    """Precomputed topology of a causal DAG whose nodes are named X1, X2, ... (inputs) and Y1, Y2, ... (outputs).
+
+    Each node is assigned an integer id by its position in dag.nodes. The index stores the adjacency matrix of the DAG,
+    the exogenous nodes, the order of the outputs in the generated source code (with the position of each output in
+    this order), and the class of every pair of nodes (input-input, input-output, output-input or output-output). The
+    index describes the DAG at the time it was built, so it must be rebuilt if the DAG is modified.
+
+    :param dag: A networkx directed graph representing a causal DAG.
+    """
+
+    def __init__(self, dag: nx.DiGraph):
+        self.nodes = list(dag.nodes)
+        self.ids = {node: node_id for node_id, node in enumerate(self.nodes)}
+        self.numbers = {node: int(node[1:]) for node in self.nodes}
+
+        self.adjacency = np.zeros((len(self.nodes), len(self.nodes)), dtype=bool)
+        for cause, effect in dag.edges:
+            self.adjacency[self.ids[cause], self.ids[effect]] = True
+        in_degrees = self.adjacency.sum(axis=0)
+        out_degrees = self.adjacency.sum(axis=1)
+        self.exogenous_nodes = [node for node, in_degree in zip(self.nodes, in_degrees) if not in_degree]
+
+        # Terminal outputs are written last, and each group of outputs is written in ascending numerical order
+        output_nodes = [node for node in self.nodes if "Y" in node]
+        self.output_order = (
+            sorted((node for node in output_nodes if out_degrees[self.ids[node]] > 0), key=self.numbers.get)
+            + sorted((node for node in output_nodes if not out_degrees[self.ids[node]]), key=self.numbers.get)
+        )
+        self.output_positions = {node: position for position, node in enumerate(self.output_order)}
+
+        is_output = np.array([node[0] == "Y" for node in self.nodes])
+        self.pair_classes = (2 * is_output[:, np.newaxis] + is_output[np.newaxis, :]).astype(np.int8)
+
+    def sort_nodes(self, nodes: list, reverse: bool = False) -> list:
+        """Sort a list of nodes in place by their numerical value only (i.e. not the X or Y in front).
+
+        :param nodes: A list of nodes in the DAG.
+        :param reverse: Whether to reverse the order (i.e. descending order).
+        :return: The sorted list.
+        """
+        nodes.sort(key=self.numbers.get, reverse=reverse)
+        return nodes
+
+    def get_non_causal_node_pairs(self) -> list:
+        """Get all pairs of nodes that do not share a directed edge and that could be joined by a valid causal edge.
+
+        See dags.dag_utils.get_non_causal_node_pairs, whose result this reproduces using vectorised operations over
+        the pairs of node ids.
+
+        :return: A list of (cause, effect) pairs of nodes.
+        """
+        causes, effects = np.triu_indices(len(self.nodes), 1)  # In the order of combinations(dag.nodes, 2)
+        pair_classes = self.pair_classes[causes, effects]
+        valid = ~(self.adjacency[causes, effects] | self.adjacency[effects, causes])
+        valid &= (pair_classes != INPUT_INPUT) & (pair_classes != OUTPUT_INPUT)
+        causes, effects, pair_classes = causes[valid], effects[valid], pair_classes[valid]
+
+        # Swap the order of output pairs if the cause appears after the effect in the source code
+        output_positions = np.array([self.output_positions.get(node, -1) for node in self.nodes])
+        swap = (pair_classes == OUTPUT_OUTPUT) & (output_positions[effects] < output_positions[causes])
+        causes, effects = np.where(swap, effects, causes), np.where(swap, causes, effects)
+        return [(self.nodes[cause], self.nodes[effect]) for cause, effect in zip(causes.tolist(), effects.tolist())]
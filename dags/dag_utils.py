@@ -1,14 +1,23 @@
 """A library of utility functions for causal DAGs."""
 import networkx as nx
+import numpy as np
 import networkx.drawing.nx_pydot
 from networkx.drawing.nx_pydot import to_pydot
 from itertools import combinations
 from helpers import safe_open_w
+from dags.dag_index import CausalDAGIndex
 from typing import List
 import json
+import os
+import pydot
 
+DAG_BINARY_SUFFIX = ".dag.npz"
 
-def get_non_causal_node_pairs(dag: nx.DiGraph):
+# Increment whenever the contents of binary DAG files change, so that their DOT files are read instead
+DAG_FORMAT_VERSION = 1
+
+
+def get_non_causal_node_pairs(dag: nx.DiGraph, index: CausalDAGIndex = None):
     """Get all pairs of nodes that do not share a directed edge in a causal DAG.
 
     This function iterates over all pairs of nodes in the graph between which there is
@@ -17,8 +26,11 @@ def get_non_causal_node_pairs(dag: nx.DiGraph):
     later output to an earlier one.
 
     :param dag: A networkx directed graph representing a causal DAG.
+    :param index: An optional CausalDAGIndex of the DAG, from which the pairs are computed in a vectorised pass.
     :return: A list of pairs of nodes that do not share a causal edge.
     """
+    if index is not None:
+        return index.get_non_causal_node_pairs()
     edges = dag.edges
     node_pairs = list(combinations(dag.nodes, 2))
     output_order = get_output_order(dag)
@@ -51,13 +63,16 @@ def get_non_causal_node_pairs(dag: nx.DiGraph):
     return valid_non_causal_node_pairs
 
 
-def get_exogenous_nodes(graph: nx.DiGraph):
+def get_exogenous_nodes(graph: nx.DiGraph, index: CausalDAGIndex = None):
     """List exogenous nodes in a given directed graph.
 
     :param graph: A networkx directed graph (nx.DiGraph)
+    :param index: An optional CausalDAGIndex of the graph, from which the nodes are read.
     :return: A list of exogenous nodes (nodes without parents) in the
              directed graph.
     """
+    if index is not None:
+        return list(index.exogenous_nodes)
     return [node for node in graph.nodes if not list(graph.predecessors(node))]
 
 
@@ -86,6 +101,34 @@ def structural_hamming_distance(
     return len(exclusive_true_edges) + len(exclusive_other_edges)
 
 
+def edge_diff(true_dag: nx.DiGraph, other_dag: nx.DiGraph) -> tuple:
+    """Get the edges that must be removed from and added to a causal DAG to obtain another.
+
+    A reversed edge appears in both lists, once in each direction.
+
+    :param true_dag: The true causal DAG.
+    :param other_dag: The graph to compare against the true causal DAG (e.g. a misspecified DAG from mutate_dag).
+    :returns: A tuple of the removed edges and the added edges, each in the edge order of its DAG.
+    """
+    removed_edges = [(cause, effect) for cause, effect in true_dag.edges if not other_dag.has_edge(cause, effect)]
+    added_edges = [(cause, effect) for cause, effect in other_dag.edges if not true_dag.has_edge(cause, effect)]
+    return removed_edges, added_edges
+
+
+def adjacency_structural_hamming_distance(true_adjacency: np.ndarray, other_adjacency: np.ndarray) -> int:
+    """Compute the structural hamming distance between a pair of graphs from their adjacency matrices.
+
+    This is equivalent to structural_hamming_distance: an edge that is present in only one of the graphs counts once,
+    and a reversed edge counts twice.
+
+    :param true_adjacency: The boolean adjacency matrix of the true causal DAG.
+    :param other_adjacency: The boolean adjacency matrix of the graph to compare against the true causal DAG, whose
+                            nodes are in the same order.
+    :returns: structural hamming distance.
+    """
+    return int(np.count_nonzero(true_adjacency ^ other_adjacency))
+
+
 def to_dot(dag: nx.DiGraph, out_path: str, **kwargs):
     """Save DAG as a DOT file at the specified out path.
 
@@ -101,6 +144,92 @@ def to_dot(dag: nx.DiGraph, out_path: str, **kwargs):
         dag_file.write(dot_dag)
 
 
+def binary_dag_path(dot_path: str) -> str:
+    """Get the path of the binary DAG file that is saved alongside a DOT file (e.g. DAG.dot -> DAG.dag.npz).
+
+    :param dot_path: Path to the DOT file.
+    :return: Path to the binary DAG file.
+    """
+    return os.path.splitext(dot_path)[0] + DAG_BINARY_SUFFIX
+
+
+def save_dag(dag: nx.DiGraph, out_path: str, **kwargs):
+    """Save DAG as a DOT file at the specified out path, and as a binary DAG file alongside it.
+
+    The binary file is an uncompressed .npz file holding the nodes, the edges as arrays of (cause, effect) node ids, and
+    the keyword arguments as JSON (the comment of the DOT file). It preserves the order of the nodes and edges, so
+    load_dag returns the same DAG as reading the DOT file, without parsing it.
+
+    :param dag: DAG to save.
+    :param out_path: Path to which the DOT file will be saved.
+    *kwargs: Additional keyword arguments
+    """
+    to_dot(dag, out_path, **kwargs)
+    ids = {node: node_id for node_id, node in enumerate(dag.nodes)}
+    edges = np.array([(ids[cause], ids[effect]) for cause, effect in dag.edges], dtype=np.int32).reshape(-1, 2)
+    np.savez(
+        binary_dag_path(out_path),
+        format_version=np.array(DAG_FORMAT_VERSION),
+        nodes=np.array(list(dag.nodes), dtype=str),
+        causes=edges[:, 0],
+        effects=edges[:, 1],
+        metadata=np.array(json.dumps(kwargs))
+    )
+
+
+def load_dag(dag_path: str) -> nx.DiGraph:
+    """Load a DAG saved with save_dag, falling back to its DOT file if there is no up-to-date binary DAG file.
+
+    :param dag_path: Path to the DOT file (or the binary DAG file) of the DAG.
+    :return: A networkx digraph object with the specified causal structure.
+    """
+    binary_path = _get_binary_dag_path(dag_path)
+    if binary_path is None:
+        return from_dot(dag_path)
+    with np.load(binary_path) as dag_file:
+        nodes = dag_file["nodes"].tolist()
+        causes = dag_file["causes"].tolist()
+        effects = dag_file["effects"].tolist()
+    dag = nx.DiGraph()
+    dag.add_nodes_from(nodes)
+    dag.add_edges_from((nodes[cause], nodes[effect]) for cause, effect in zip(causes, effects))
+    return dag
+
+
+def load_dag_metadata(dag_path: str) -> dict:
+    """Load the metadata of a DAG (the keyword arguments it was saved with) and the number of nodes and edges.
+
+    :param dag_path: Path to the DOT file (or the binary DAG file) of the DAG.
+    :return: A dictionary of the metadata, with the additional keys "n_nodes" and "n_edges".
+    """
+    binary_path = _get_binary_dag_path(dag_path)
+    if binary_path is None:
+        graph = pydot.graph_from_dot_file(dag_path)[0]
+        metadata = json.loads(json.loads(graph.get_comment()))
+        return metadata | {"n_nodes": len(graph.get_nodes()), "n_edges": len(graph.get_edges())}
+    with np.load(binary_path) as dag_file:
+        metadata = json.loads(str(dag_file["metadata"]))
+        return metadata | {"n_nodes": len(dag_file["nodes"]), "n_edges": len(dag_file["causes"])}
+
+
+def _get_binary_dag_path(dag_path: str):
+    """Get the path of the binary DAG file to load for a DAG, or None if the DOT file must be read instead.
+
+    The binary file is only used if it was written with the current format and is at least as recent as the DOT file,
+    so DOT files that were written or edited by other tools are still read.
+    """
+    binary_path = dag_path if dag_path.endswith(DAG_BINARY_SUFFIX) else binary_dag_path(dag_path)
+    if not os.path.exists(binary_path):
+        return None
+    if binary_path != dag_path and os.path.exists(dag_path) \
+            and os.path.getmtime(binary_path) < os.path.getmtime(dag_path):
+        return None
+    with np.load(binary_path) as dag_file:
+        if int(dag_file["format_version"]) != DAG_FORMAT_VERSION:
+            return None
+    return binary_path
+
+
 def from_dot(path_to_dot_graph):
     """Load a dot specification of a DAG to a networkx DiGraph.
 
@@ -110,7 +239,7 @@ def from_dot(path_to_dot_graph):
     dag = networkx.drawing.nx_pydot.read_dot(path_to_dot_graph)
     return dag
 
-def get_output_order(causal_dag: nx.DiGraph):
+def get_output_order(causal_dag: nx.DiGraph, index: CausalDAGIndex = None):
     """Gets the order of the outputs as they appear in the source code.
 
        The source code for a causal DAG is generated bottom-up, starting
@@ -120,9 +249,13 @@ def get_output_order(causal_dag: nx.DiGraph):
        the node index.
 
        :param causal_dag: Causal DAG to obtain the output order of.
+       :param index: An optional CausalDAGIndex of the DAG, from which the
+       order is read.
        :return outputs: A list of outputs in the order they appear
        in the source code.
     """
+    if index is not None:
+        return list(index.output_order)
     output_nodes = [
         node for node in causal_dag if "Y" in node
     ]
@@ -148,14 +281,17 @@ def get_output_order(causal_dag: nx.DiGraph):
     return nodes_in_source_code_order
 
 
-def sort_causal_dag_nodes(nodes: List, reverse: bool = False) -> List:
+def sort_causal_dag_nodes(nodes: List, reverse: bool = False, index: CausalDAGIndex = None) -> List:
     """Sort a list of causal DAG nodes based on the numerical value only (i.e. not the X or Y in front).
 
     This method assumes that all nodes start with a single character and are strictly followed by integers.
 
     :param nodes: A list of strings representing nodes.
     :param reverse: Whether to reverse the order (i.e. descending order).
+    :param index: An optional CausalDAGIndex of the DAG, whose parsed node numbers are used as sort keys.
     :return:
     """
+    if index is not None:
+        return index.sort_nodes(nodes, reverse)
     nodes.sort(key=lambda node: int(node[1:]), reverse=reverse)
     return nodes
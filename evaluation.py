@@ -1,17 +1,21 @@
+import json
 import os.path
 import random
 import glob
-import networkx as nx
 import importlib.util
 import sys
 import shutil
 from time import time
 from argparse import ArgumentParser
-from dags.dag_generation import generate_dag, mutate_dag
+from dags.dag_generation import generate_dag, mutate_dag_levels
+from dags.dag_index import CausalDAGIndex
 from programs.program_generation import generate_program
-from metamorphic_relations.metamorphic_relation_generation import generate_metamorphic_relations
+from metamorphic_relations.metamorphic_relation_generation import (iter_metamorphic_relations,
+                                                                   generate_metamorphic_relations,
+                                                                   update_metamorphic_relations)
 from mutation_testing.mutation_config_generation import generate_causal_mutation_config
 from helpers import safe_open_w
+from dags.dag_utils import load_dag, edge_diff
 
 
 def generate_experiment(
@@ -20,7 +24,8 @@ def generate_experiment(
     p_edge: float,
     p_conditional: float,
     experiment_directory_path: str = "./evaluation/experiment/",
-    seed: int = 0
+    seed: int = 0,
+    dag_sampler: str = "networkx"
 ):
     """Generate an experiment with user specified DAGs.
 
@@ -35,6 +40,7 @@ def generate_experiment(
     :param p_conditional: Probability of a node being made conditional.
     :param experiment_directory_path: A string denoting the name of the experiment.
     :param seed: Seed for reproducibility.
+    :param dag_sampler: The sampler used to generate each DAG ("networkx" or "numpy", see generate_dag).
     """
     params_path = f"{experiment_directory_path}/params.txt"
     random.seed(seed)
@@ -52,9 +58,10 @@ def generate_experiment(
         dag_path = os.path.join(dag_dir_path, "original_dag", "DAG.dot")
 
         # Generate DAG and record nodes and edges
-        dag = generate_dag(n_nodes, p_edge, p_conditional, seed=seed, dot_path=dag_path)
+        dag = generate_dag(n_nodes, p_edge, p_conditional, seed=seed, dot_path=dag_path, sampler=dag_sampler)
         total_nodes += len(dag.nodes)
         total_edges += len(dag.edges)
+        dag_index = CausalDAGIndex(dag)
 
         p_g_start_time = time()
         generate_program(
@@ -71,6 +78,7 @@ def generate_experiment(
         generate_causal_mutation_config(
             dag,
             target_directory_path=dag_path.replace("DAG.dot", "mutation_config.toml"),
+            index=dag_index
         )
         c_m_g_end_time = time()
         print(f"Causal mutation generation run time: "
@@ -78,16 +86,29 @@ def generate_experiment(
 
         # Create increasingly more misspecified DAGs
         m_ds_start_time = time()
-        for p_invert in [0.25, 0.5, 0.75, 1]:
-            out_path = os.path.join(dag_dir_path, f"misspecified_dag_{int(p_invert*100)}/DAG.dot")
-            mutant_dag = mutate_dag(dag, p_invert, out_path, seed)
+        p_inverts = [0.25, 0.5, 0.75, 1]
+        out_paths = [os.path.join(dag_dir_path, f"misspecified_dag_{int(p_invert*100)}/DAG.dot")
+                     for p_invert in p_inverts]
+        mutated_dags = mutate_dag_levels(dag, p_inverts, out_paths, seed, index=dag_index)
+        for out_path in out_paths:
             generate_causal_mutation_config(
                 dag,
                 target_directory_path=out_path.replace("DAG.dot", "mutation_config.toml"),
+                index=dag_index
             )
         m_ds_end_time = time()
         print(f"Mutate DAGs run time: {m_ds_end_time - m_ds_start_time}")
 
+        # Record the metamorphic relations that each level of misspecification changes
+        m_rs_start_time = time()
+        relations = generate_metamorphic_relations(dag)
+        for mutated_dag, out_path in zip(mutated_dags, out_paths):
+            removed_edges, added_edges = edge_diff(dag, mutated_dag)
+            relation_diff = update_metamorphic_relations(relations, mutated_dag, removed_edges, added_edges)
+            write_relation_diff(out_path.replace("DAG.dot", "relation_diff.json"), relation_diff)
+        m_rs_end_time = time()
+        print(f"Misspecified relations run time: {m_rs_end_time - m_rs_start_time}")
+
     average_nodes = total_nodes / n_dags
     average_edges = total_edges / n_dags
     write_params(params_path, n_dags, n_nodes, p_edge, experiment_directory_path,
@@ -120,18 +141,37 @@ def generate_and_execute_metamorphic_relations(program_path, dag_path):
     :param program_path: Path to the specified program.
     :param dag_path: Path to the specified causal DAG representing the causal relationships in the program.
     """
-    true_dag = nx.nx_pydot.read_dot(dag_path)
+    true_dag = load_dag(dag_path)
     mod_spec = importlib.util.spec_from_file_location("program.program", program_path)
     program = importlib.util.module_from_spec(mod_spec)
-    metamorphic_relations = generate_metamorphic_relations(true_dag)
     sys.modules["program.program"] = program
     mod_spec.loader.exec_module(program)
-    for metamorphic_relation in metamorphic_relations:
+    for metamorphic_relation in iter_metamorphic_relations(true_dag):
         print(f"Testing: {metamorphic_relation}")
         metamorphic_relation.generate_tests()
         metamorphic_relation.execute_tests(program.program)
 
 
+def write_relation_diff(path: str, relation_diff):
+    """Write the metamorphic relations changed by a misspecified DAG to a JSON file at the specified path.
+
+    :param path: Path for the relation diff JSON file to be saved to.
+    :param relation_diff: A MetamorphicRelationDiff returned by update_metamorphic_relations.
+    """
+    with safe_open_w(path) as relation_diff_file:
+        json.dump(
+            {
+                "n_relations": len(relation_diff.relations),
+                "added": [str(relation) for relation in relation_diff.added.values()],
+                "removed": [str(relation) for relation in relation_diff.removed.values()],
+                "changed": [[str(base_relation), str(relation)]
+                            for base_relation, relation in relation_diff.changed.values()]
+            },
+            relation_diff_file,
+            indent=2
+        )
+
+
 def write_params(
     path: str, n_dags: int, n_nodes: int, p_edge: float, experiment_name: str,
     a_nodes: float, a_edges: float
@@ -183,6 +223,13 @@ if __name__ == "__main__":
     parser.add_argument("-en", "--experiment", help="Path to store the experiment", type=str)
     parser.add_argument("-s", "--seed", help="Random seed", type=int)
     parser.add_argument("-t", "--task", help="Task to conduct: 'gen' for generation or 'run' for running experiments.")
+    parser.add_argument(
+        "-ds",
+        "--dag-sampler",
+        help="Sampler used to generate DAGs: 'networkx' (default) or 'numpy', which scales to much larger DAGs",
+        choices=["networkx", "numpy"],
+        default="networkx"
+    )
     args = parser.parse_args()
     number_of_dags = 1
     number_of_nodes = 10
@@ -211,7 +258,8 @@ if __name__ == "__main__":
             probability_of_edge,
             p_conditional=probability_of_conditional,
             experiment_directory_path=experiment_directory_path,
-            seed=seed
+            seed=seed,
+            dag_sampler=args.dag_sampler
         )
         end_time = time()
         print(f"Experiment generation time: {end_time - start_time}s")
@@ -1,5 +1,9 @@
 """A library of helper functions."""
 import os
+import numpy as np
+
+# Populations of at most this many pairs are sampled by enumerating them
+MAX_ENUMERATED_PAIRS = 2 ** 16
 
 
 def safe_open_w(path):
@@ -14,3 +18,55 @@ def safe_open_w(path):
 
     os.makedirs(os.path.dirname(path), exist_ok=True)
     return open(path, "w")
+
+
+def unrank_pairs(ranks, n_values: int) -> np.ndarray:
+    """Get the pairs of distinct values in range(n_values) with the given ranks in the order of itertools.combinations.
+
+    The pair (i, j), where i < j, has rank i * (2 * n_values - i - 1) / 2 + (j - i - 1), so each pair is computed in
+    constant time without materialising the combinations.
+
+    :param ranks: An array of ranks in [0, n_values * (n_values - 1) / 2).
+    :param n_values: The number of values.
+    :return: An (n x 2) array of the pairs (i, j) with the given ranks.
+    """
+    ranks = np.asarray(ranks, dtype=np.int64)
+
+    def first_rank(i):
+        return i * (2 * n_values - i - 1) // 2
+
+    # Invert first_rank, correcting for any floating point error in the square root
+    first = np.floor(((2 * n_values - 1) - np.sqrt((2 * n_values - 1) ** 2 - 8 * ranks.astype(np.float64))) / 2)
+    first = first.astype(np.int64)
+    first = np.where(first_rank(first + 1) <= ranks, first + 1, first)
+    first = np.where(first_rank(first) > ranks, first - 1, first)
+    return np.column_stack((first, ranks - first_rank(first) + first + 1))
+
+
+def sample_distinct_pairs(lower: int, upper: int, sample_size: int, random_state=np.random) -> np.ndarray:
+    """Sample pairs of distinct values in [lower, upper] without replacement.
+
+    Small populations are sampled with random_state.choice, which draws the same pairs as sampling from the full list
+    of combinations. Otherwise, pair ranks are drawn with replacement and duplicates are redrawn, so the memory used is
+    proportional to sample_size rather than to the number of pairs.
+
+    :param lower: The inclusive lower bound of the values.
+    :param upper: The inclusive upper bound of the values.
+    :param sample_size: The number of pairs to sample.
+    :param random_state: The source of randomness: np.random, a np.random.RandomState or a np.random.Generator.
+    :return: A (sample_size x 2) array of pairs, whose first value is less than the second.
+    """
+    n_values = upper - lower + 1
+    n_pairs = n_values * (n_values - 1) // 2
+    if sample_size > n_pairs:
+        raise ValueError(f"Cannot sample {sample_size} distinct pairs from the {n_pairs} pairs in [{lower}, {upper}].")
+    if n_pairs <= max(2 * sample_size, MAX_ENUMERATED_PAIRS):
+        ranks = random_state.choice(n_pairs, sample_size, replace=False)
+    else:
+        draw = random_state.integers if isinstance(random_state, np.random.Generator) else random_state.randint
+        ranks = np.empty(0, dtype=np.int64)
+        while len(ranks) < sample_size:
+            ranks = np.concatenate((ranks, draw(0, n_pairs, size=sample_size - len(ranks), dtype=np.int64)))
+            _, first_positions = np.unique(ranks, return_index=True)
+            ranks = ranks[np.sort(first_positions)]
+    return lower + unrank_pairs(ranks, n_values)
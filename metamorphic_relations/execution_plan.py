@@ -0,0 +1,90 @@
+"""A plan for executing the tests of many metamorphic relations with as few program calls as possible."""
+from collections import defaultdict
+from typing import List
+from metamorphic_relations.metamorphic_relation import CausalMetamorphicRelation, InputDomains
+
+
+class ExecutionPlan:
+    """Execute the tests of metamorphic relations that intervene on the same variable and fix the same variables
+    together.
+
+    The tests of a relation are determined by the variables it intervenes on and fixes, the sample size, the seed and the
+    domains of the variables (see CausalMetamorphicRelation.generate_tests). Tests fix every input of the DAG other than
+    the input variable, so the variables of the tests only depend on the relation's test key: its input variable and the
+    adjustment variables that are outputs. Relations with the same test key therefore have identical test inputs, so the
+    plan generates these inputs once per group, executes the program once per source and follow-up input of each test,
+    and checks the assertion of every relation in the group against the returned outputs. The results are identical to
+    executing the tests of each relation separately.
+
+    How much can be fused is limited by the structure of the DAG: the adjustment list of a relation contains the parents
+    of its input and output variables, so relations whose outputs have different output parents fix different outputs,
+    and are tested with different inputs, even if they intervene on the same variable.
+
+    :param relations: The metamorphic relations to execute.
+    :param sample_size: Number of tests to generate per relation.
+    :param seed: A random seed for reproducibility.
+    :param domains: The domains of the variables (see InputDomains). Defaults to [-10, 10] for every variable.
+    :param independent_streams: Whether each group draws its tests from its own random stream (see
+                                CausalMetamorphicRelation.random_generator).
+    """
+
+    def __init__(self, relations: List[CausalMetamorphicRelation], sample_size: int = 1, seed: int = 0,
+                 domains: InputDomains = None, independent_streams: bool = False):
+        self.relations = list(relations)
+        groups = defaultdict(list)
+        for position, relation in enumerate(self.relations):
+            groups[relation.test_key].append(position)
+        self.groups = list(groups.values())
+        self.executions = 0
+
+        for group in self.groups:
+            representative = self.relations[group[0]]
+            representative.generate_tests(sample_size=sample_size, seed=seed, domains=domains,
+                                          independent_streams=independent_streams)
+            for position in group[1:]:
+                relation = self.relations[position]
+                relation.tests = [(source_input, follow_up_input, other_inputs, relation.output_var, relation)
+                                  for source_input, follow_up_input, other_inputs, _, _ in representative.tests]
+
+    def execute(self, program, short_circuit: bool = False) -> tuple:
+        """Execute the tests of every relation against a program.
+
+        :param program: The program under test.
+        :param short_circuit: Whether to stop checking the assertion of each relation once its oracle outcome is known.
+                              The tests of a group stop being executed once the outcomes of all of its relations are
+                              known.
+        :return: A list of failures for each relation (which can be passed to its oracle), in the order of
+                 self.relations, and the number of program executions skipped by short-circuiting.
+        """
+        failures = [[] for _ in self.relations]
+        skipped_executions = 0
+        for group in self.groups:
+            pending = list(group)
+            tests = self.relations[group[0]].tests
+            for position in group:
+                self.relations[position].skipped_tests = 0
+            for executed_tests, (source_input, follow_up_input, other_inputs, _, _) in enumerate(tests, start=1):
+                source_outputs = program(**(other_inputs | source_input))
+                follow_up_outputs = program(**(other_inputs | follow_up_input))
+                self.executions += 2
+                for position in pending:
+                    relation = self.relations[position]
+                    control = source_outputs[relation.output_var]
+                    treatment = follow_up_outputs[relation.output_var]
+                    if not relation.assertion(control, treatment, relation.tests[executed_tests - 1]):
+                        failures[position].append({
+                            "source_inputs": (other_inputs | source_input),
+                            "source_outcome": control,
+                            "follow_up_inputs": (other_inputs | follow_up_input),
+                            "follow_up_outcome": treatment
+                        })
+                if short_circuit:
+                    decided = [position for position in pending
+                               if self.relations[position].oracle_decided(len(failures[position]), executed_tests)]
+                    for position in decided:
+                        self.relations[position].skipped_tests = len(tests) - executed_tests
+                    pending = [position for position in pending if position not in decided]
+                    if not pending:
+                        skipped_executions += 2 * (len(tests) - executed_tests)
+                        break
+        return failures, skipped_executions
@@ -1,10 +1,15 @@
 """Causal metamorphic relation classes."""
+import hashlib
+import json
+import sys
 from abc import ABC, abstractmethod
-from typing import List
-from itertools import combinations
+from typing import Iterable, List, Union
 import networkx as nx
 import pandas as pd
 import numpy as np
+from helpers import sample_distinct_pairs
+
+DEFAULT_DOMAIN = (-10, 10)
 
 
 def count(lst):
@@ -16,42 +21,147 @@ def count(lst):
     return counts
 
 
+class InputIndex:
+    """The input variables of a causal DAG, shared by all metamorphic relations generated from that DAG.
+
+    Relations hold a reference to this index rather than to the DAG itself, so that the DAG does not need to be scanned
+    for its inputs every time a relation generates tests.
+
+    :param inputs: The names of the input variables.
+    """
+
+    __slots__ = ("inputs",)
+
+    def __init__(self, inputs: Iterable[str]):
+        self.inputs = frozenset(sys.intern(variable) for variable in inputs)
+
+    @classmethod
+    def from_dag(cls, dag: nx.DiGraph):
+        """Build the index of the input (X) variables of a causal DAG.
+
+        :param dag: A networkx directed graph representing a causal DAG.
+        :return: An InputIndex for the DAG.
+        """
+        return cls(node for node in dag.nodes if "X" in node)
+
+
+class InputDomains:
+    """The range of values that tests assign to each variable.
+
+    Configured domains are inclusive: fixed inputs and the source and follow-up values of an intervention are all
+    sampled from [lower, upper], where the values of an intervention are distinct. Variables without a configured domain
+    use the default domain, which is [-10, 10] unless another is given. To reproduce the tests generated before domains
+    were configurable, this built-in default draws fixed inputs from the half-open range [-10, 10).
+
+    :param domains: A dictionary mapping variable names to inclusive (lower, upper) integer bounds.
+    :param default: The inclusive bounds of any variable that is not in domains. Defaults to the built-in default.
+    """
+
+    __slots__ = ("domains", "default", "inclusive_default")
+
+    def __init__(self, domains: dict = None, default: tuple = None):
+        self.inclusive_default = default is not None
+        self.default = _to_integer_bounds("default", DEFAULT_DOMAIN if default is None else default)
+        self.domains = {variable: _to_integer_bounds(variable, bounds) for variable, bounds in (domains or {}).items()}
+
+    @classmethod
+    def from_json(cls, path: str):
+        """Read the domains from a JSON file of the form {"default": [-10, 10], "variables": {"X1": [0, 100]}}.
+
+        :param path: Path to the JSON file. Both keys are optional.
+        :return: The InputDomains.
+        """
+        with open(path) as domains_file:
+            domains = json.load(domains_file)
+        return cls(domains.get("variables"), domains.get("default"))
+
+    def __getitem__(self, variable: str) -> tuple:
+        return self.domains.get(variable, self.default)
+
+    def fixed_bounds(self, variable: str) -> tuple:
+        """Get the half-open bounds [lower, upper) that the value of a fixed variable is drawn from.
+
+        :param variable: The name of the variable.
+        :return: A tuple (lower, upper), which excludes upper.
+        """
+        lower, upper = self[variable]
+        if variable in self.domains or self.inclusive_default:
+            return lower, upper + 1
+        return lower, upper
+
+    def __str__(self):
+        default = list(self.default) if self.inclusive_default else "built-in"
+        return f"{default}:{sorted((variable, list(bounds)) for variable, bounds in self.domains.items())}"
+
+
+def _to_integer_bounds(variable: str, bounds) -> tuple:
+    """Convert the bounds of a domain to ints, checking that they are integral and contain at least two values."""
+    lower, upper = bounds
+    if int(lower) != lower or int(upper) != upper:
+        raise ValueError(f"The domain of {variable} must have integer bounds, not [{lower}, {upper}].")
+    lower, upper = int(lower), int(upper)
+    if lower >= upper:
+        raise ValueError(f"The domain of {variable} must contain at least two values, not [{lower}, {upper}].")
+    return lower, upper
+
+
 class CausalMetamorphicRelation(ABC):
-    """A metamorphic relation base class."""
+    """A metamorphic relation base class.
+
+    :param input_var: The variable that is intervened upon.
+    :param output_var: The variable that is observed.
+    :param adjustment_list: The variables whose values are fixed.
+    :param dag: Either the causal DAG the relation was generated from, or an InputIndex shared by all relations
+                generated from that DAG.
+    """
+
+    __slots__ = ("input_var", "output_var", "adjustment_list", "input_index", "tests", "skipped_tests")
 
-    def __init__(self, input_var: str, output_var: str, adjustment_list: List[str], dag: nx.DiGraph):
-        self.input_var = input_var
-        self.output_var = output_var
-        self.adjustment_list = sorted(adjustment_list)
-        self.dag = dag
+    def __init__(self, input_var: str, output_var: str, adjustment_list: List[str],
+                 dag: Union[nx.DiGraph, InputIndex]):
+        self.input_var = sys.intern(input_var)
+        self.output_var = sys.intern(output_var)
+        self.adjustment_list = tuple(sorted(sys.intern(variable) for variable in adjustment_list))
+        self.input_index = dag if isinstance(dag, InputIndex) else InputIndex.from_dag(dag)
         self.tests = None
+        self.skipped_tests = 0
 
-    def generate_tests(self, sample_size=1, seed=0):
-        np.random.seed(seed)
+    def generate_tests(self, sample_size=1, seed=0, domains: InputDomains = None, independent_streams: bool = False):
+        """Generate the tests of this relation, storing them in self.tests.
+
+        The tests are drawn from a random state that belongs to this call, so relations can generate their tests
+        concurrently, in any order, without changing them.
+
+        :param sample_size: Number of tests to generate.
+        :param seed: A random seed for reproducibility.
+        :param domains: The domains of the variables (see InputDomains). Defaults to [-10, 10] for every variable.
+        :param independent_streams: Whether to draw the tests from the relation's own stream (see random_generator).
+                                    By default, every relation draws from a RandomState seeded with the seed, which
+                                    reproduces the tests generated by earlier versions.
+        """
+        random_state = self.random_generator(seed) if independent_streams else np.random.RandomState(seed)
+        draw = random_state.integers if independent_streams else random_state.randint
+        domains = InputDomains() if domains is None else domains
         source_input = self.input_var
         follow_up_input = f"{self.input_var}_prime"
 
         # Get all input values apart from the source_input and the adjustment list
-        test_inputs = set()
-        for node in self.dag.nodes:
-            if ("X" in node) and (node != source_input):
-                test_inputs.add(node)
-        test_inputs = list(test_inputs | set(self.adjustment_list))
+        test_inputs = list((self.input_index.inputs - {source_input}) | set(self.adjustment_list))
 
         assert source_input not in test_inputs, f"{source_input} should NOT be in {test_inputs}"
         assert len(test_inputs) == len(set(test_inputs)), f"Input names not unique {test_inputs} {count(test_inputs)}"
 
-        # Assign random values to inputs between -10 and 10
+        # Assign random values to inputs from their domains
+        test_inputs = sorted(test_inputs)
+        bounds = np.array([domains.fixed_bounds(variable) for variable in test_inputs], dtype=np.int64).reshape(-1, 2)
         input_samples = pd.DataFrame(
-            np.random.randint(-10, 10, size=(sample_size, len(test_inputs))),
-            columns=sorted(test_inputs)
+            draw(bounds[:, 0], bounds[:, 1], size=(sample_size, len(test_inputs))),
+            columns=test_inputs
         )
 
         # Sample without replacement from the possible interventions (source and follow-up input pairs)
-        candidate_interventions = np.array(list(combinations(range(-10, 11), 2)))
-        random_intervention_indices = np.random.choice(candidate_interventions.shape[0], sample_size, replace=False)
         intervention_samples = pd.DataFrame(
-            candidate_interventions[random_intervention_indices],
+            sample_distinct_pairs(*domains[source_input], sample_size, random_state),
             columns=sorted([source_input] + [follow_up_input])
         )
         source_input_values = intervention_samples[[source_input]]
@@ -69,12 +179,57 @@ class CausalMetamorphicRelation(ABC):
             )
         )
 
-    def execute_tests(self, program) -> List[dict]:
+    @property
+    def test_key(self) -> tuple:
+        """The input variable and the adjustment variables that are not inputs of the DAG.
+
+        Tests fix every input of the DAG other than the input variable, together with the adjustment list, so the
+        adjustment variables that are inputs never change the variables of the tests. Relations with the same test key
+        therefore generate identical tests for the same seed and domains, and can be executed together (see
+        metamorphic_relations/execution_plan.py).
+        """
+        return self.input_var, tuple(
+            variable for variable in self.adjustment_list if variable not in self.input_index.inputs
+        )
+
+    def random_generator(self, seed: int = 0) -> np.random.Generator:
+        """Get a random generator whose stream is specific to the interventions tested by this relation.
+
+        The generator is spawned from a SeedSequence of the seed with a key of all eight 32-bit words of a SHA-256
+        digest of the relation's test key, so its stream is reproducible and, in practice, never shared with relations
+        that intervene on another variable or fix other variables. Relations with the same test key share a stream,
+        and hence their tests.
+
+        :param seed: A random seed for reproducibility.
+        :return: A numpy random Generator.
+        """
+        input_var, fixed_outputs = self.test_key
+        digest = hashlib.sha256(f"{input_var}|{','.join(fixed_outputs)}".encode()).digest()
+        relation_key = tuple(int.from_bytes(digest[start:start + 4], "big") for start in range(0, len(digest), 4))
+        return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=relation_key))
+
+    def execute_tests(self, program, short_circuit: bool = False, follow_up_program=None) -> List[dict]:
+        """Execute the tests of this relation against a program.
+
+        :param program: The program under test.
+        :param short_circuit: Whether to stop executing tests as soon as the outcome of the oracle is known. The number
+                              of tests that were not executed as a result is stored in self.skipped_tests.
+        :param follow_up_program: An optional function that computes the outputs of a follow-up run from the outputs of
+                                  its source run and the follow-up inputs (see programs.program_execution.
+                                  IncrementalProgram). By default, the follow-up run executes the program from scratch.
+        :return: A list of failures, which can be passed to the oracle.
+        """
         failures = []
-        for run in self.tests:
+        self.skipped_tests = 0
+        for executed_tests, run in enumerate(self.tests, start=1):
             source_input, follow_up_input, other_inputs, output, independence = run
-            control = program(**(other_inputs | source_input))[output]
-            treatment = program(**(other_inputs | follow_up_input))[output]
+            if follow_up_program is None:
+                control = program(**(other_inputs | source_input))[output]
+                treatment = program(**(other_inputs | follow_up_input))[output]
+            else:
+                source_outputs = program(**(other_inputs | source_input))
+                control = source_outputs[output]
+                treatment = follow_up_program(source_outputs, **(other_inputs | follow_up_input))[output]
             if not self.assertion(control, treatment, run):
                 failures.append({
                     "source_inputs": (other_inputs | source_input),
@@ -82,6 +237,9 @@ class CausalMetamorphicRelation(ABC):
                     "follow_up_inputs": (other_inputs | follow_up_input),
                     "follow_up_outcome": treatment
                 })
+            if short_circuit and self.oracle_decided(len(failures), executed_tests):
+                self.skipped_tests = len(self.tests) - executed_tests
+                break
 
         return failures
 
@@ -95,22 +253,33 @@ class CausalMetamorphicRelation(ABC):
         """An oracle procedure that determines whether the MR holds or not based on the test failures."""
         ...
 
+    @abstractmethod
+    def oracle_decided(self, n_failures, n_executed):
+        """Whether the outcome of the oracle is known after executing n_executed tests, n_failures of which failed."""
+        ...
+
 
 class ShouldCause(CausalMetamorphicRelation):
     """A causal metamorphic relation asserting that changes to the input x should cause y to change when fixing the
     value of variables in the adjustment list.
     """
 
+    __slots__ = ()
+
     def assertion(self, source_output, follow_up_output, run):
         return source_output != follow_up_output
 
     def oracle(self, test_failures):
         assert len(test_failures) < len(self.tests), f"{str(self)}: {len(test_failures)}/{len(self.tests)} tests failed."
 
+    def oracle_decided(self, n_failures, n_executed):
+        # A single passing test is sufficient for the relation to hold
+        return n_failures < n_executed
+
     def __str__(self):
         metamorphic_relation_str = f"{self.input_var} --> {self.output_var}"
         if self.adjustment_list:
-            metamorphic_relation_str += f" | {self.adjustment_list}"
+            metamorphic_relation_str += f" | {list(self.adjustment_list)}"
         return metamorphic_relation_str
 
     def __repr__(self):
@@ -122,16 +291,22 @@ class ShouldNotCause(CausalMetamorphicRelation):
     value of variables in the adjustment list.
     """
 
+    __slots__ = ()
+
     def assertion(self, source_output, follow_up_output, run):
         return source_output == follow_up_output
 
     def oracle(self, test_failures):
         assert len(test_failures) == 0, f"{str(self)} failed: {len(test_failures)}/{len(self.tests)} tests failed."
 
+    def oracle_decided(self, n_failures, n_executed):
+        # A single failing test is sufficient for the relation to fail
+        return n_failures > 0
+
     def __str__(self):
         metamorphic_relation_string = f"{self.input_var} _||_ {self.output_var}"
         if self.adjustment_list:
-            metamorphic_relation_string += f" | {self.adjustment_list}"
+            metamorphic_relation_string += f" | {list(self.adjustment_list)}"
         return metamorphic_relation_string
 
     def __repr__(self):
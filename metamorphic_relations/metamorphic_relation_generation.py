@@ -1,47 +1,306 @@
 """Functions for generating metamorphic relations from a causal DAG."""
 import networkx as nx
-from itertools import combinations
-from metamorphic_relations.metamorphic_relation import ShouldCause, ShouldNotCause
+from itertools import accumulate, combinations
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from metamorphic_relations.metamorphic_relation import (
+    CausalMetamorphicRelation,
+    ShouldCause,
+    ShouldNotCause,
+    InputIndex
+)
 from dags.dag_generation import generate_dag
+from dags.d_separation import DSeparationEngine
 from dags.dag_utils import from_dot
 
+MetamorphicRelationDiff = namedtuple("MetamorphicRelationDiff", ["relations", "added", "removed", "changed"])
 
-def generate_metamorphic_relations(dag: nx.DiGraph):
-    """Generate a list of metamorphic relations based on the structure of a causal DAG."""
+
+def generate_metamorphic_relations(dag: nx.DiGraph, workers: int = 1):
+    """Generate a list of metamorphic relations based on the structure of a causal DAG.
+
+    :param dag: A networkx directed graph representing a causal DAG.
+    :param workers: Number of processes to shard the node pairs across. Defaults to 1 (serial). The relations are
+                    returned in the same order regardless of the number of workers.
+    :return: A list of ShouldCause and ShouldNotCause metamorphic relations.
+    """
+    return list(iter_metamorphic_relations(dag, workers))
+
+
+def iter_metamorphic_relations(dag: nx.DiGraph, workers: int = 1):
+    """Lazily generate the metamorphic relations implied by the structure of a causal DAG.
+
+    Relations are yielded one at a time, in the same order as generate_metamorphic_relations, so that they can be
+    tested as soon as they are generated without holding every relation in memory.
+
+    :param dag: A networkx directed graph representing a causal DAG.
+    :param workers: Number of processes to shard the node pairs across. Defaults to 1 (serial).
+    :return: A generator of ShouldCause and ShouldNotCause metamorphic relations.
+    """
     assert nx.is_directed_acyclic_graph(dag), "Error: Graph is not a DAG."
-    metamorphic_relations = []
+    if workers > 1:
+        yield from iter_metamorphic_relations_in_parallel(dag, workers)
+        return
+
+    d_separation_engine = DSeparationEngine(dag)
+    input_index = InputIndex.from_dag(dag)
 
     # Iterate over all unique pairs of variables in the DAG
-    unique_node_pairs = list(combinations(dag.nodes, 2))
-    for node_pair in unique_node_pairs:
-        cause, effect = node_pair
+    for cause, effect in combinations(dag.nodes, 2):
+        relation_specification = get_relation_specification(dag, d_separation_engine, cause, effect)
+        if relation_specification is not None:
+            relation_class, input_var, output_var, adjustment_list = relation_specification
+            yield relation_class(input_var, output_var, adjustment_list, input_index)
 
-        # Do not check causality or independence amongst inputs
-        if "X" in cause and "X" in effect:
-            continue
 
-        # Adjust for the parents of the cause and effect to isolate the hypothesised causal effect of interest
-        adjustment_set = set(dag.predecessors(cause)) | set(dag.predecessors(effect))
+def update_metamorphic_relations(base_relations: List[CausalMetamorphicRelation], dag: nx.DiGraph,
+                                 removed_edges: List[tuple], added_edges: List[tuple]):
+    """Update the metamorphic relations of a causal DAG for a modified version of that DAG.
+
+    The relation implied for a pair of nodes only depends on the parents of the two nodes (its adjustment set) and on
+    the edge between them, so only the pairs that contain a node whose parents are changed by the edge diff (or a node
+    that is only in one of the DAGs) are generated again, and the rest keep their base relation.
+
+    If the modified DAG has the same nodes as the base DAG, in the same order (as for the DAGs returned by mutate_dag),
+    the position of each pair in the base relations is computed directly, so the relations of the regenerated pairs are
+    replaced in a copy of the base relations. Beyond copying the list, the cost of the update is then proportional to
+    the number of regenerated pairs, i.e. to the number of nodes whose parents changed times the number of nodes.
+    Otherwise, the relations are matched to their pairs and reordered, which takes time proportional to the number of
+    relations.
+
+    :param base_relations: The metamorphic relations generated from the base DAG (see generate_metamorphic_relations),
+                           in the order they were generated.
+    :param dag: A networkx directed graph representing the modified causal DAG.
+    :param removed_edges: The edges of the base DAG that are not in the modified DAG (see dags.dag_utils.edge_diff).
+    :param added_edges: The edges of the modified DAG that are not in the base DAG.
+    :return: A MetamorphicRelationDiff. Its relations are those of the modified DAG, in the order they are returned by
+             generate_metamorphic_relations, where the relations of unchanged pairs are those of the base DAG. The added
+             and removed relations, and the (base, modified) relations that changed, are dictionaries keyed by the
+             unordered pair of nodes (a frozenset) of each relation.
+    """
+    assert nx.is_directed_acyclic_graph(dag), "Error: Graph is not a DAG."
+    nodes = list(dag.nodes)
+    positions = {node: position for position, node in enumerate(nodes)}
+    changed_nodes = {effect for _, effect in removed_edges + added_edges}
+    d_separation_engine = DSeparationEngine(dag)
+    input_index = InputIndex.from_dag(dag)
 
-        # Confirm that adjustment set satisfies d-separation
-        assert nx.d_separated(dag, {cause}, {effect}, adjustment_set), \
-               f"{adjustment_set} does not d-separate {cause} and {effect} "
+    if changed_nodes <= positions.keys():
+        relation_diff = _replace_relations(base_relations, dag, nodes, positions, changed_nodes, d_separation_engine,
+                                           input_index)
+        if relation_diff is not None:
+            return relation_diff
+    return _merge_relations(base_relations, dag, nodes, positions, changed_nodes, d_separation_engine, input_index)
 
-        # Where an edge is present, test for causality, otherwise test for independence
-        if (cause, effect) in dag.edges:
-            adjustment_set -= {cause}  # Remove the cause from adjustment set, where cause --> effect
-            metamorphic_relations.append(ShouldCause(cause, effect, list(adjustment_set - {cause}), dag))
-        elif (effect, cause) in dag.edges:
-            adjustment_set -= {effect}  # Remove the effect from adjustment set, where effect --> cause
-            metamorphic_relations.append(ShouldCause(effect, cause, list(adjustment_set - {effect}), dag))
+
+def _replace_relations(base_relations, dag, nodes, positions, changed_nodes, d_separation_engine, input_index):
+    """Replace the relations of the pairs that contain a changed node in a copy of the base relations.
+
+    The base relations must be those of a DAG with the same nodes, in the same order, as the modified DAG, i.e. one
+    relation per pair of combinations(nodes, 2) that is not a pair of inputs. The position of a pair (i, j) is then the
+    number of such pairs whose first node precedes i, plus the number of nodes between i and j, less the number of
+    inputs between i and j if i is an input.
+
+    :return: A MetamorphicRelationDiff, or None if the base relations are not those of a DAG with the same nodes.
+    """
+    is_input = ["X" in node for node in nodes]
+    inputs_before = list(accumulate(is_input, initial=0))
+    n_nodes, n_inputs = len(nodes), inputs_before[-1]
+    row_starts = list(accumulate(
+        (n_nodes - position - 1 - (n_inputs - inputs_before[position + 1] if is_input[position] else 0)
+         for position in range(n_nodes)),
+        initial=0
+    ))
+    if not base_relations or len(base_relations) != row_starts[-1] \
+            or base_relations[0].input_index.inputs != input_index.inputs:
+        return None
+
+    relations = list(base_relations)
+    changed = {}
+    changed_positions = {positions[node] for node in changed_nodes}
+    for changed_position in sorted(changed_positions):
+        for other_position in range(n_nodes):
+            # Visit each pair of changed nodes once
+            if other_position == changed_position or (other_position < changed_position
+                                                      and other_position in changed_positions):
+                continue
+            first, second = sorted((changed_position, other_position))
+            if is_input[first] and is_input[second]:
+                continue
+            relation_position = row_starts[first] + second - first - 1
+            if is_input[first]:
+                relation_position -= inputs_before[second] - inputs_before[first + 1]
+            base_relation = relations[relation_position]
+            pair = frozenset((nodes[first], nodes[second]))
+            if not pair == {base_relation.input_var, base_relation.output_var}:
+                return None
+
+            relation_class, input_var, output_var, adjustment_list = get_relation_specification(
+                dag, d_separation_engine, nodes[first], nodes[second]
+            )
+            relation = relation_class(input_var, output_var, adjustment_list, input_index)
+            if not _same_relation(base_relation, relation):
+                changed[pair] = (base_relation, relation)
+                relations[relation_position] = relation
+    return MetamorphicRelationDiff(relations, {}, {}, changed)
+
+
+def _merge_relations(base_relations, dag, nodes, positions, changed_nodes, d_separation_engine, input_index):
+    """Regenerate the relations of the pairs that contain a changed node or a node that is only in one of the DAGs,
+    matching every relation to its pair of nodes.
+
+    :return: A MetamorphicRelationDiff.
+    """
+    relations = {frozenset((relation.input_var, relation.output_var)): relation for relation in base_relations}
+    base_nodes = set().union(*relations) if relations else set()
+    if base_relations and base_relations[0].input_index.inputs != input_index.inputs:
+        relations = {pair: type(relation)(relation.input_var, relation.output_var, relation.adjustment_list,
+                                          input_index)
+                     for pair, relation in relations.items()}
+
+    affected_nodes = changed_nodes | (positions.keys() ^ base_nodes)
+    added, removed, changed = {}, {}, {}
+    affected_pairs = {frozenset((node, other_node)) for node in affected_nodes & positions.keys()
+                      for other_node in nodes if other_node != node}
+    for pair in affected_pairs:
+        cause, effect = sorted(pair, key=positions.get)
+        relation_specification = get_relation_specification(dag, d_separation_engine, cause, effect)
+        if relation_specification is None:
+            if pair in relations:
+                removed[pair] = relations.pop(pair)
+            continue
+        relation_class, input_var, output_var, adjustment_list = relation_specification
+        relation = relation_class(input_var, output_var, adjustment_list, input_index)
+        base_relation = relations.get(pair)
+        if base_relation is None:
+            added[pair] = relation
+        elif not _same_relation(base_relation, relation):
+            changed[pair] = (base_relation, relation)
         else:
-            try:
-                cause, effect = sort_node_pair(cause, effect)
-            except ValueError:
-                cause, effect = cause, effect  # Can't sort the nodes (not X, Y format)
-            metamorphic_relations.append(ShouldNotCause(cause, effect, list(adjustment_set), dag))
+            continue
+        relations[pair] = relation
+
+    # Relations of the nodes that are not in the modified DAG are removed
+    removed.update((pair, relation) for pair, relation in relations.items() if not pair <= positions.keys())
+
+    ordered_relations = [relations[frozenset((cause, effect))] for cause, effect in combinations(nodes, 2)
+                         if frozenset((cause, effect)) in relations]
+    return MetamorphicRelationDiff(ordered_relations, added, removed, changed)
+
+
+def _same_relation(relation: CausalMetamorphicRelation, other_relation: CausalMetamorphicRelation) -> bool:
+    """Whether two metamorphic relations make the same assertion."""
+    return (type(relation) is type(other_relation)
+            and relation.input_var == other_relation.input_var
+            and relation.output_var == other_relation.output_var
+            and relation.adjustment_list == other_relation.adjustment_list)
+
+
+def iter_metamorphic_relations_in_parallel(dag: nx.DiGraph, workers: int):
+    """Generate the metamorphic relations implied by a causal DAG using a pool of processes.
+
+    The DAG is shipped to each worker once, when the worker is started. The node pairs are then sharded by the position
+    of their first node, such that each shard covers a contiguous run of combinations(dag.nodes, 2). Workers only
+    return the specification of each relation, which is turned into a relation object in the parent process as each
+    shard completes.
+
+    :param dag: A networkx directed graph representing a causal DAG.
+    :param workers: Number of processes to use.
+    :return: A generator of ShouldCause and ShouldNotCause metamorphic relations, ordered as in the serial case.
+    """
+    shards = get_node_pair_shards(len(dag.nodes), workers * 4)
+    input_index = InputIndex.from_dag(dag)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initialise_worker, initargs=(dag,)) as executor:
+        for relation_specifications in executor.map(_get_shard_relation_specifications, shards):
+            for relation_class, input_var, output_var, adjustment_list in relation_specifications:
+                yield relation_class(input_var, output_var, adjustment_list, input_index)
+
+
+def get_node_pair_shards(n_nodes: int, n_shards: int):
+    """Split the first-node positions of all unique node pairs into contiguous shards of roughly equal size.
+
+    The node at position i is the first node of n_nodes - i - 1 pairs, so the shards are balanced by pair count rather
+    than by number of positions.
+
+    :param n_nodes: Number of nodes in the DAG.
+    :param n_shards: Desired number of shards.
+    :return: A list of (start, stop) position ranges.
+    """
+    pairs_per_shard = max(1, (n_nodes * (n_nodes - 1) // 2) // max(1, n_shards))
+    shards = []
+    start = 0
+    shard_pairs = 0
+    for position in range(n_nodes):
+        shard_pairs += n_nodes - position - 1
+        if shard_pairs >= pairs_per_shard:
+            shards.append((start, position + 1))
+            start = position + 1
+            shard_pairs = 0
+    if start < n_nodes:
+        shards.append((start, n_nodes))
+    return shards
+
+
+_worker_dag = None
+_worker_d_separation_engine = None
+
+
+def _initialise_worker(dag: nx.DiGraph):
+    """Store the DAG and its d-separation engine in a worker process."""
+    global _worker_dag, _worker_d_separation_engine
+    _worker_dag = dag
+    _worker_d_separation_engine = DSeparationEngine(dag)
+
+
+def _get_shard_relation_specifications(shard):
+    """Get the relation specifications for all node pairs whose first node lies in the given shard."""
+    start, stop = shard
+    nodes = list(_worker_dag.nodes)
+    relation_specifications = []
+    for cause_position in range(start, stop):
+        for effect in nodes[cause_position + 1:]:
+            relation_specification = get_relation_specification(
+                _worker_dag, _worker_d_separation_engine, nodes[cause_position], effect
+            )
+            if relation_specification is not None:
+                relation_specifications.append(relation_specification)
+    return relation_specifications
+
+
+def get_relation_specification(dag: nx.DiGraph, d_separation_engine: DSeparationEngine, cause, effect):
+    """Get the class, input, output, and adjustment list of the metamorphic relation implied for a pair of nodes.
+
+    :param dag: A networkx directed graph representing a causal DAG.
+    :param d_separation_engine: A d-separation engine for the DAG.
+    :param cause: The first node of the pair.
+    :param effect: The second node of the pair.
+    :return: A tuple (relation_class, input_var, output_var, adjustment_list), or None if no relation is implied.
+    """
+    # Do not check causality or independence amongst inputs
+    if "X" in cause and "X" in effect:
+        return None
+
+    # Adjust for the parents of the cause and effect to isolate the hypothesised causal effect of interest
+    adjustment_set = d_separation_engine.adjustment_set(cause, effect)
+
+    # Confirm that adjustment set satisfies d-separation
+    assert d_separation_engine.d_separated({cause}, {effect}, adjustment_set), \
+           f"{adjustment_set} does not d-separate {cause} and {effect} "
 
-    return metamorphic_relations
+    # Where an edge is present, test for causality, otherwise test for independence
+    if (cause, effect) in dag.edges:
+        adjustment_set -= {cause}  # Remove the cause from adjustment set, where cause --> effect
+        return ShouldCause, cause, effect, list(adjustment_set - {cause})
+    elif (effect, cause) in dag.edges:
+        adjustment_set -= {effect}  # Remove the effect from adjustment set, where effect --> cause
+        return ShouldCause, effect, cause, list(adjustment_set - {effect})
+    else:
+        try:
+            cause, effect = sort_node_pair(cause, effect)
+        except ValueError:
+            cause, effect = cause, effect  # Can't sort the nodes (not X, Y format)
+        return ShouldNotCause, cause, effect, list(adjustment_set)
 
 
 def sort_node_pair(node_a, node_b):
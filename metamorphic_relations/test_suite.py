@@ -0,0 +1,547 @@
+"""A columnar store of the metamorphic tests generated for every relation of a causal DAG."""
+import argparse
+import hashlib
+import os
+import struct
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from typing import List
+import numpy as np
+from metamorphic_relations.metamorphic_relation import (
+    CausalMetamorphicRelation,
+    InputDomains,
+    InputIndex,
+    ShouldCause,
+    ShouldNotCause
+)
+from metamorphic_relations.metamorphic_relation_generation import iter_metamorphic_relations
+from helpers import sample_distinct_pairs
+from dags.dag_utils import load_dag
+
+RELATION_CLASSES = {relation_class.__name__: relation_class for relation_class in [ShouldCause, ShouldNotCause]}
+
+# Increment whenever the contents of saved test suites change, so that existing suites are rebuilt
+TEST_SUITE_FORMAT_VERSION = 2
+
+CANDIDATE_INTERVENTIONS = np.array(list(combinations(range(-10, 11), 2)))
+
+# The arrays of a saved test suite that are memory-mapped when it is loaded
+MEMORY_MAPPED_ARRAYS = ["offsets", "source_values", "follow_up_values", "input_values", "input_mask"]
+
+RelationTests = namedtuple("RelationTests", ["relation", "source_values", "follow_up_values", "input_values",
+                                             "input_variables"])
+
+
+class TestSuite:
+    """The metamorphic tests for a list of relations, stored as contiguous integer arrays.
+
+    The tests of relation i occupy rows offsets[i] to offsets[i + 1] of every array, and relation_index records which
+    relation each row belongs to. Fixed input values are stored in a single matrix with a column per variable that is
+    fixed by at least one relation; input_mask records which of these columns are used by each relation.
+
+    :param relations: The metamorphic relations the tests belong to.
+    :param variables: The names of the columns of input_values.
+    :param offsets: An array of length len(relations) + 1 delimiting the rows of each relation.
+    :param source_values: The value of the input variable in the source execution of each test.
+    :param follow_up_values: The value of the input variable in the follow-up execution of each test.
+    :param input_values: A (tests x variables) matrix of fixed input values.
+    :param input_mask: A (relations x variables) boolean matrix marking the fixed inputs of each relation.
+    """
+
+    def __init__(self, relations: List[CausalMetamorphicRelation], variables: List[str], offsets: np.ndarray,
+                 source_values: np.ndarray, follow_up_values: np.ndarray, input_values: np.ndarray,
+                 input_mask: np.ndarray):
+        self.relations = relations
+        self.variables = list(variables)
+        self.offsets = offsets
+        self.relation_index = np.repeat(np.arange(len(relations)), np.diff(offsets))
+        self.source_values = source_values
+        self.follow_up_values = follow_up_values
+        self.input_values = input_values
+        self.input_mask = input_mask
+
+    @classmethod
+    def generate(cls, relations: List[CausalMetamorphicRelation], sample_size: int = 1, seed: int = 0,
+                 domains: InputDomains = None):
+        """Generate sample_size tests for every relation in a single vectorised pass.
+
+        As in CausalMetamorphicRelation.generate_tests, fixed inputs are sampled uniformly from [-10, 10) and the
+        source and follow-up values of each relation are sampled without replacement from the pairs of distinct values
+        in [-10, 10], unless other domains are given. The values drawn differ from those drawn by generate_tests for the
+        same seed.
+
+        :param relations: The metamorphic relations to generate tests for.
+        :param sample_size: Number of tests to generate per relation.
+        :param seed: A random seed for reproducibility.
+        :param domains: The domains of the variables (see InputDomains). Defaults to [-10, 10] for every variable.
+        :return: A TestSuite containing the generated tests.
+        """
+        if domains is None and sample_size > len(CANDIDATE_INTERVENTIONS):
+            raise ValueError(f"Cannot sample {sample_size} distinct interventions from "
+                             f"{len(CANDIDATE_INTERVENTIONS)} candidates.")
+        rng = np.random.default_rng(seed)
+
+        relation_inputs = [
+            (relation.input_index.inputs - {relation.input_var}) | set(relation.adjustment_list)
+            for relation in relations
+        ]
+        variables = sorted(set().union(*relation_inputs))
+        variable_positions = {variable: position for position, variable in enumerate(variables)}
+        input_mask = np.zeros((len(relations), len(variables)), dtype=bool)
+        for relation_position, test_inputs in enumerate(relation_inputs):
+            input_mask[relation_position, [variable_positions[variable] for variable in test_inputs]] = True
+
+        n_tests = len(relations) * sample_size
+        offsets = np.arange(len(relations) + 1) * sample_size
+        if domains is None:
+            input_values = rng.integers(-10, 10, size=(n_tests, len(variables)))
+
+            # Rank a random key per candidate intervention to sample without replacement for every relation at once
+            random_keys = rng.random((len(relations), len(CANDIDATE_INTERVENTIONS)))
+            intervention_indices = np.argsort(random_keys, axis=1)[:, :sample_size].ravel()
+            interventions = CANDIDATE_INTERVENTIONS[intervention_indices]
+        else:
+            bounds = np.array([domains.fixed_bounds(variable) for variable in variables], dtype=np.int64).reshape(-1, 2)
+            input_values = rng.integers(bounds[:, 0], bounds[:, 1], size=(n_tests, len(variables)))
+            interventions = np.concatenate(
+                [sample_distinct_pairs(*domains[relation.input_var], sample_size, rng) for relation in relations]
+            ).reshape(-1, 2)
+
+        return cls(relations, variables, offsets, interventions[:, 0], interventions[:, 1], input_values, input_mask)
+
+    @classmethod
+    def from_relations(cls, relations: List[CausalMetamorphicRelation]):
+        """Collect the tests that each relation generated with CausalMetamorphicRelation.generate_tests.
+
+        :param relations: The metamorphic relations, whose tests must already have been generated.
+        :return: A TestSuite containing the relations' tests.
+        """
+        relation_inputs = [
+            (relation.input_index.inputs - {relation.input_var}) | set(relation.adjustment_list)
+            for relation in relations
+        ]
+        variables = sorted(set().union(*relation_inputs))
+        variable_positions = {variable: position for position, variable in enumerate(variables)}
+        input_mask = np.zeros((len(relations), len(variables)), dtype=bool)
+        offsets = np.zeros(len(relations) + 1, dtype=np.int64)
+        for relation_position, (relation, test_inputs) in enumerate(zip(relations, relation_inputs)):
+            input_mask[relation_position, [variable_positions[variable] for variable in test_inputs]] = True
+            offsets[relation_position + 1] = offsets[relation_position] + len(relation.tests)
+
+        source_values = np.zeros(offsets[-1], dtype=np.int64)
+        follow_up_values = np.zeros(offsets[-1], dtype=np.int64)
+        input_values = np.zeros((offsets[-1], len(variables)), dtype=np.int64)
+        row = 0
+        for relation in relations:
+            for source_input, follow_up_input, other_inputs, _, _ in relation.tests:
+                source_values[row] = source_input[relation.input_var]
+                follow_up_values[row] = follow_up_input[relation.input_var]
+                for variable, value in other_inputs.items():
+                    input_values[row, variable_positions[variable]] = value
+                row += 1
+
+        return cls(relations, variables, offsets, source_values, follow_up_values, input_values, input_mask)
+
+    def assign_tests(self):
+        """Set the tests of every relation in the suite, in the format produced by generate_tests.
+
+        This allows a suite that has been loaded from a file to be executed with CausalMetamorphicRelation.execute_tests
+        and checked with the relation oracles.
+        """
+        for relation_position, relation in enumerate(self.relations):
+            _, source_values, follow_up_values, input_values, input_variables = self.view(relation_position)
+            input_columns = np.flatnonzero(self.input_mask[relation_position])
+            relation.tests = [
+                ({relation.input_var: source_value}, {relation.input_var: follow_up_value},
+                 dict(zip(input_variables, other_values)), relation.output_var, relation)
+                for source_value, follow_up_value, other_values in zip(source_values.tolist(),
+                                                                       follow_up_values.tolist(),
+                                                                       input_values[:, input_columns].tolist())
+            ]
+
+    def save(self, path: str, content_hash: str = ""):
+        """Save the relations and tests to an uncompressed .npz file, so that their arrays can be memory-mapped.
+
+        :param path: The path to save the test suite to (a .npz extension is appended if missing).
+        :param content_hash: A hash identifying the DAG and settings the suite was generated from.
+        """
+        inputs = sorted(set().union(*(relation.input_index.inputs for relation in self.relations)))
+        np.savez(
+            path,
+            content_hash=np.array(content_hash),
+            relation_classes=np.array([type(relation).__name__ for relation in self.relations], dtype=str),
+            input_vars=np.array([relation.input_var for relation in self.relations], dtype=str),
+            output_vars=np.array([relation.output_var for relation in self.relations], dtype=str),
+            adjustment_lists=np.array([",".join(relation.adjustment_list) for relation in self.relations], dtype=str),
+            inputs=np.array(inputs, dtype=str),
+            variables=np.array(self.variables, dtype=str),
+            offsets=self.offsets,
+            source_values=self.source_values,
+            follow_up_values=self.follow_up_values,
+            input_values=self.input_values,
+            input_mask=self.input_mask
+        )
+
+    @classmethod
+    def load(cls, path: str):
+        """Load a test suite saved with TestSuite.save.
+
+        The relations are read from the file, but the arrays of tests are memory-mapped (read-only), so only the pages
+        of the tests that are used are read from disk.
+
+        :param path: The path of the saved test suite.
+        :return: A tuple of the TestSuite and the content hash it was saved with.
+        """
+        arrays = _memory_map_arrays(path, MEMORY_MAPPED_ARRAYS)
+        with np.load(path) as suite_file:
+            input_index = InputIndex(suite_file["inputs"].tolist())
+            relations = [
+                RELATION_CLASSES[relation_class](input_var, output_var,
+                                                 adjustment_list.split(",") if adjustment_list else [], input_index)
+                for relation_class, input_var, output_var, adjustment_list in zip(
+                    suite_file["relation_classes"].tolist(), suite_file["input_vars"].tolist(),
+                    suite_file["output_vars"].tolist(), suite_file["adjustment_lists"].tolist()
+                )
+            ]
+            test_suite = cls(relations, suite_file["variables"].tolist(), arrays["offsets"], arrays["source_values"],
+                             arrays["follow_up_values"], arrays["input_values"], arrays["input_mask"])
+            return test_suite, str(suite_file["content_hash"])
+
+    def __len__(self):
+        return len(self.source_values)
+
+    def view(self, relation_position: int) -> RelationTests:
+        """Get the tests of a single relation without copying the underlying arrays.
+
+        :param relation_position: The position of the relation in self.relations.
+        :return: A RelationTests tuple whose arrays are views of the suite's arrays. Only the columns of input_values
+                 named in input_variables are fixed inputs of the relation.
+        """
+        start, stop = self.offsets[relation_position], self.offsets[relation_position + 1]
+        input_variables = [
+            variable for variable, used in zip(self.variables, self.input_mask[relation_position]) if used
+        ]
+        return RelationTests(
+            self.relations[relation_position],
+            self.source_values[start:stop],
+            self.follow_up_values[start:stop],
+            self.input_values[start:stop],
+            input_variables
+        )
+
+    def execute_tests(self, relation_position: int, program) -> List[dict]:
+        """Execute the tests of a single relation, mirroring CausalMetamorphicRelation.execute_tests.
+
+        :param relation_position: The position of the relation in self.relations.
+        :param program: The program under test.
+        :return: A list of failures, in the same format as CausalMetamorphicRelation.execute_tests.
+        """
+        relation, source_values, follow_up_values, input_values, input_variables = self.view(relation_position)
+        input_columns = np.flatnonzero(self.input_mask[relation_position])
+        output = relation.output_var
+        failures = []
+        for source_value, follow_up_value, other_values in zip(source_values.tolist(), follow_up_values.tolist(),
+                                                                 input_values[:, input_columns].tolist()):
+            other_inputs = dict(zip(input_variables, other_values))
+            source_inputs = other_inputs | {relation.input_var: source_value}
+            follow_up_inputs = other_inputs | {relation.input_var: follow_up_value}
+            control = program(**source_inputs)[output]
+            treatment = program(**follow_up_inputs)[output]
+            if not relation.assertion(control, treatment, None):
+                failures.append({
+                    "source_inputs": source_inputs,
+                    "source_outcome": control,
+                    "follow_up_inputs": follow_up_inputs,
+                    "follow_up_outcome": treatment
+                })
+        return failures
+
+    def execute(self, program) -> List[List[dict]]:
+        """Execute the tests of every relation in the suite.
+
+        :param program: The program under test.
+        :return: A list containing the failures of each relation.
+        """
+        return [self.execute_tests(relation_position, program) for relation_position in range(len(self.relations))]
+
+    def execute_vectorised(self, vectorised_program) -> List[List[dict]]:
+        """Execute the tests of every relation in the suite using a vectorised twin of the program under test.
+
+        The whole suite is evaluated with a single source and a single follow-up call to the vectorised program. Each
+        output that is fixed or intervened upon by at least one relation is passed as a masked array, which is only
+        unmasked in the rows of the relations that fix or intervene upon it.
+
+        :param vectorised_program: A vectorised program, as produced by programs/program_vectorisation.py.
+        :return: A list containing the failures of each relation, in the same format as execute.
+        """
+        row_input_vars = np.array([relation.input_var for relation in self.relations], dtype=object)[
+            self.relation_index
+        ]
+        row_input_masks = self.input_mask[self.relation_index]
+        inputs = set().union(*(relation.input_index.inputs for relation in self.relations))
+        variable_positions = {variable: position for position, variable in enumerate(self.variables)}
+
+        source_inputs = {}
+        follow_up_inputs = {}
+        for variable in sorted(inputs | set(self.variables) | set(row_input_vars)):
+            if variable in variable_positions:
+                given_rows = row_input_masks[:, variable_positions[variable]]
+                values = self.input_values[:, variable_positions[variable]]
+            else:
+                given_rows = np.zeros(len(self), dtype=bool)
+                values = np.zeros(len(self), dtype=self.input_values.dtype)
+            intervened_rows = row_input_vars == variable
+            source_values = np.where(intervened_rows, self.source_values, values)
+            follow_up_values = np.where(intervened_rows, self.follow_up_values, values)
+            if variable not in inputs:
+                not_given_rows = ~(given_rows | intervened_rows)
+                source_values = np.ma.MaskedArray(source_values, mask=not_given_rows)
+                follow_up_values = np.ma.MaskedArray(follow_up_values, mask=not_given_rows)
+            source_inputs[variable] = source_values
+            follow_up_inputs[variable] = follow_up_values
+
+        source_outputs = vectorised_program(**source_inputs)
+        follow_up_outputs = vectorised_program(**follow_up_inputs)
+
+        failures = []
+        for relation_position, relation in enumerate(self.relations):
+            start, stop = self.offsets[relation_position], self.offsets[relation_position + 1]
+            control = source_outputs[relation.output_var][start:stop]
+            treatment = follow_up_outputs[relation.output_var][start:stop]
+            passed = np.asarray(relation.assertion(control, treatment, None))
+            relation_variables = [
+                variable for variable, used in zip(self.variables, self.input_mask[relation_position]) if used
+            ] + [relation.input_var]
+            failures.append([
+                {
+                    "source_inputs": {variable: source_inputs[variable].item(row) for variable in relation_variables},
+                    "source_outcome": source_outputs[relation.output_var].item(row),
+                    "follow_up_inputs": {variable: follow_up_inputs[variable].item(row)
+                                         for variable in relation_variables},
+                    "follow_up_outcome": follow_up_outputs[relation.output_var].item(row)
+                }
+                for row in start + np.flatnonzero(~passed)
+            ])
+        return failures
+
+
+def generate_relation_tests(relations: List[CausalMetamorphicRelation], sample_size: int = 1, seed: int = 0,
+                            domains: InputDomains = None, independent_streams: bool = False, workers: int = 1):
+    """Generate the tests of every relation with CausalMetamorphicRelation.generate_tests, optionally using a pool of
+    processes.
+
+    Each relation draws its tests from its own random state, so the tests are identical regardless of the number of
+    workers. Workers only return the test inputs, which are attached to the relations in the parent process.
+
+    :param relations: The metamorphic relations to generate tests for.
+    :param sample_size: Number of tests to generate per relation.
+    :param seed: A random seed for reproducibility.
+    :param domains: The domains of the variables (see InputDomains). Defaults to [-10, 10] for every variable.
+    :param independent_streams: Whether each relation draws its tests from its own random stream (see
+                                CausalMetamorphicRelation.random_generator).
+    :param workers: Number of processes to generate the tests with. Defaults to 1 (serial).
+    """
+    if workers <= 1:
+        for relation in relations:
+            relation.generate_tests(sample_size=sample_size, seed=seed, domains=domains,
+                                    independent_streams=independent_streams)
+        return
+
+    relation_specifications = [
+        (type(relation).__name__, relation.input_var, relation.output_var, relation.adjustment_list,
+         relation.input_index)
+        for relation in relations
+    ]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initialise_worker,
+                             initargs=(sample_size, seed, domains, independent_streams)) as executor:
+        chunksize = max(1, len(relations) // (workers * 4))
+        for relation, tests in zip(relations, executor.map(_generate_tests, relation_specifications,
+                                                           chunksize=chunksize)):
+            relation.tests = [(source_input, follow_up_input, other_inputs, relation.output_var, relation)
+                              for source_input, follow_up_input, other_inputs in tests]
+
+
+_worker_test_settings = None
+
+
+def _initialise_worker(sample_size: int, seed: int, domains: InputDomains, independent_streams: bool):
+    """Store the settings used to generate tests in a worker process."""
+    global _worker_test_settings
+    _worker_test_settings = {"sample_size": sample_size, "seed": seed, "domains": domains,
+                             "independent_streams": independent_streams}
+
+
+def _generate_tests(relation_specification):
+    """Generate the tests of a relation in a worker process, returning their inputs."""
+    relation_class, input_var, output_var, adjustment_list, input_index = relation_specification
+    relation = RELATION_CLASSES[relation_class](input_var, output_var, adjustment_list, input_index)
+    relation.generate_tests(**_worker_test_settings)
+    return [(source_input, follow_up_input, other_inputs) for source_input, follow_up_input, other_inputs, _, _ in
+            relation.tests]
+
+
+def _memory_map_arrays(path: str, names: List[str]) -> dict:
+    """Memory-map arrays stored in an uncompressed .npz file, as np.load ignores mmap_mode for .npz files.
+
+    Each array is stored in the .npz (zip) file as a .npy member. As the members are not compressed, the data of each
+    array is found after the local header of its member and the header of the .npy format.
+
+    :param path: The path of the .npz file.
+    :param names: The names of the arrays to memory-map.
+    :return: A dictionary mapping each name to a read-only memory-mapped array.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zip_file, open(path, "rb") as npz_file:
+        for name in names:
+            member = zip_file.getinfo(f"{name}.npy")
+            assert member.compress_type == zipfile.ZIP_STORED, f"Cannot memory-map compressed array {name}."
+            npz_file.seek(member.header_offset)
+            local_header = npz_file.read(30)
+            name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+            npz_file.seek(member.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(npz_file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(npz_file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(npz_file)
+            if 0 in shape:
+                arrays[name] = np.empty(shape, dtype=dtype)  # An empty file region cannot be mapped
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=npz_file.tell(), shape=shape,
+                                         order="F" if fortran_order else "C")
+    return arrays
+
+
+def get_test_suite_hash(dag_path: str, seed: int, sample_size: int, domains: InputDomains = None,
+                        independent_streams: bool = False) -> str:
+    """Hash the contents of a DAG file together with the settings used to generate its tests.
+
+    :param dag_path: Path to the DOT file of the causal DAG.
+    :param seed: The random seed used to generate the tests.
+    :param sample_size: The number of tests generated per relation.
+    :param domains: The domains of the variables, if not the default.
+    :param independent_streams: Whether each relation drew its tests from its own random stream.
+    :return: A hex digest identifying the test suite.
+    """
+    content_hash = hashlib.sha256()
+    with open(dag_path, "rb") as dag_file:
+        content_hash.update(dag_file.read())
+    content_hash.update(f"{TEST_SUITE_FORMAT_VERSION}:{seed}:{sample_size}".encode())
+    if domains is not None:
+        content_hash.update(f":{domains}".encode())
+    if independent_streams:
+        content_hash.update(b":independent")
+    return content_hash.hexdigest()
+
+
+def get_test_suite_path(suite_path: str) -> str:
+    """Get the path a test suite is saved to, appending the .npz extension if it is missing (as np.savez does).
+
+    :param suite_path: The path of a test suite, with or without the .npz extension.
+    :return: The path of the test suite with the .npz extension.
+    """
+    return suite_path if suite_path.endswith(".npz") else f"{suite_path}.npz"
+
+
+def build_test_suite(dag_path: str, suite_path: str, seed: int = 0, sample_size: int = 1,
+                     domains: InputDomains = None, independent_streams: bool = False, workers: int = 1) -> TestSuite:
+    """Generate the relations implied by a DAG and their tests, and save them as a test suite.
+
+    The tests are generated with CausalMetamorphicRelation.generate_tests, so executing the saved suite produces the
+    same results as regenerating the relations and tests in programs/program_testing.py.
+
+    :param dag_path: Path to the DOT file of the causal DAG.
+    :param suite_path: The path to save the test suite to (a .npz extension is appended if missing).
+    :param seed: A random seed for reproducibility.
+    :param sample_size: Number of tests to generate per relation.
+    :param domains: The domains of the variables (see InputDomains). Defaults to [-10, 10] for every variable.
+    :param independent_streams: Whether each relation draws its tests from its own random stream (see
+                                CausalMetamorphicRelation.random_generator).
+    :param workers: Number of processes to generate the tests with. Defaults to 1 (serial).
+    :return: The generated TestSuite.
+    """
+    relations = list(iter_metamorphic_relations(load_dag(dag_path)))
+    generate_relation_tests(relations, sample_size=sample_size, seed=seed, domains=domains,
+                            independent_streams=independent_streams, workers=workers)
+    test_suite = TestSuite.from_relations(relations)
+    test_suite.save(get_test_suite_path(suite_path),
+                    get_test_suite_hash(dag_path, seed, sample_size, domains, independent_streams))
+    return test_suite
+
+
+def load_test_suite(dag_path: str, suite_path: str, seed: int = 0, sample_size: int = 1,
+                    domains: InputDomains = None, independent_streams: bool = False) -> TestSuite:
+    """Load the test suite for a DAG, rebuilding it if it does not exist or is stale.
+
+    A saved suite is stale if its content hash does not match that of the DAG file and the settings used to generate
+    its tests.
+
+    :param dag_path: Path to the DOT file of the causal DAG.
+    :param suite_path: The path of the saved test suite (a .npz extension is appended if missing).
+    :param seed: A random seed for reproducibility.
+    :param sample_size: Number of tests to generate per relation.
+    :param domains: The domains of the variables (see InputDomains). Defaults to [-10, 10] for every variable.
+    :param independent_streams: Whether each relation draws its tests from its own random stream (see
+                                CausalMetamorphicRelation.random_generator).
+    :return: The TestSuite.
+    """
+    suite_path = get_test_suite_path(suite_path)
+    if os.path.exists(suite_path):
+        test_suite, content_hash = TestSuite.load(suite_path)
+        if content_hash == get_test_suite_hash(dag_path, seed, sample_size, domains, independent_streams):
+            return test_suite
+        del test_suite  # Unmap the stale suite before it is overwritten
+        print(f"Rebuilding stale test suite {suite_path}")
+    return build_test_suite(dag_path, suite_path, seed, sample_size, domains, independent_streams)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the test suite for a causal DAG."
+    )
+    parser.add_argument('-d',
+                        '--dag',
+                        help="Path to causal dag.",
+                        required=True,
+                        )
+    parser.add_argument('-o',
+                        '--outfile',
+                        help="Path to save the test suite (.npz).",
+                        required=True,
+                        )
+    parser.add_argument('-s',
+                        '--seed',
+                        help="A random seed for reproducibility. Defaults to 0.",
+                        required=False,
+                        type=int,
+                        default=0)
+    parser.add_argument('-t',
+                        '--tests',
+                        help="Number of tests to generate per relation.",
+                        required=False,
+                        type=int,
+                        default=1)
+    parser.add_argument('--domains',
+                        help="Path to a JSON file of variable domains, e.g. "
+                             "{\"default\": [-10, 10], \"variables\": {\"X1\": [0, 100]}}.",
+                        required=False,
+                        )
+    parser.add_argument('--independent-streams',
+                        help="Draw the tests of each relation from its own random stream.",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        dest='independent_streams'
+                        )
+    parser.add_argument('-w',
+                        '--workers',
+                        help="Number of processes to generate the tests with. Defaults to 1.",
+                        required=False,
+                        type=int,
+                        default=1)
+    args = parser.parse_args()
+    domains = InputDomains.from_json(args.domains) if args.domains is not None else None
+    suite = build_test_suite(args.dag, args.outfile, seed=args.seed, sample_size=args.tests, domains=domains,
+                             independent_streams=bool(args.independent_streams), workers=args.workers)
+    print(f"Saved {len(suite.relations)} relations and {len(suite)} tests to {get_test_suite_path(args.outfile)}")
@@ -0,0 +1,108 @@
+"""A pre-pass that classifies causal mutants before they are executed.
+
+Each mutant listed in a mutation configuration is classified as:
+    - equivalent: every output block of the mutant is identical to the original's, or provably computes the same
+      value (see programs.program_analysis.blocks_equivalent), so its test results are those of the original program;
+    - killed or survived: the verdict of every metamorphic relation is decided symbolically for the mutant (see
+      programs.program_analysis.SymbolicAnalyser), so its test results are known without executing it;
+    - execute: otherwise.
+
+Only mutants classified as execute need to be tested, and only against the relations that could not be decided. The
+pre-pass is run by mutation_testing/mutant_schemata.py with --prepass, which can also write a copy of the mutation
+configuration that only lists these mutants (for cosmic-ray).
+"""
+import ast
+import tomlkit
+from programs.program_analysis import get_program_function, get_output_blocks, SymbolicAnalyser, blocks_equivalent
+from programs.program_testing import test_relations, get_failures
+
+EQUIVALENT = "equivalent"
+KILLED = "killed"
+SURVIVED = "survived"
+EXECUTE = "execute"
+
+
+class MutantClassifier:
+    """Classify the mutants of a generated program.
+
+    The program is parsed and analysed once, and each mutant is compared with it block by block, so that only the
+    blocks a mutant changes, and the outputs that descend from them, are analysed again.
+
+    :param source: The source code of the original program.
+    :param relations: The metamorphic relations whose tests have been generated.
+    :param baseline_results: The results of testing the original program (one dict per relation, as returned by
+                             test_relations).
+    :param program_name: The name of the function under test.
+    """
+
+    def __init__(self, source: str, relations: list, baseline_results: list, program_name: str = "program"):
+        # Mutants are written by ast.unparse, so most of their blocks are textually identical to the original's
+        self.source = ast.unparse(ast.parse(source))
+        self.relations = relations
+        self.baseline_results = baseline_results
+        self.program_name = program_name
+        self.output_blocks = get_output_blocks(get_program_function(ast.parse(self.source), program_name))
+        self.block_sources = _get_block_sources(self.source, self.output_blocks)
+        self.analyser = SymbolicAnalyser(self.source, program_name)
+
+    def classify(self, mutant_source: str) -> tuple:
+        """Classify a mutant of the program.
+
+        Only the relations whose output can be affected by the mutant (i.e. the outputs whose blocks are changed and
+        their descendants) are analysed; the rest keep their baseline results.
+
+        :param mutant_source: The source code of the mutant.
+        :return: The classification of the mutant and its test results (one dict per relation, as returned by
+                 test_relations). If the mutant must be executed, the results of the relations that must be executed
+                 are None.
+        """
+        mutant_output_blocks = get_output_blocks(get_program_function(ast.parse(mutant_source), self.program_name))
+        if list(mutant_output_blocks) != list(self.output_blocks):
+            return EXECUTE, [None] * len(self.relations)
+        mutant_block_sources = _get_block_sources(mutant_source, mutant_output_blocks)
+        changed_blocks = {output: block for output, block in mutant_output_blocks.items()
+                          if mutant_block_sources[output] != self.block_sources[output]
+                          and not blocks_equivalent(self.output_blocks[output].body, block.body)}
+        if not changed_blocks:
+            return EQUIVALENT, list(self.baseline_results)
+
+        analyser = self.analyser.mutate(changed_blocks)
+        results = []
+        for relation, baseline_result in zip(self.relations, self.baseline_results):
+            if relation.output_var not in analyser.affected_outputs:
+                results.append(baseline_result)
+            elif analyser.output_changes(relation.input_var, relation.output_var, relation.adjustment_list) is None:
+                results.append(None)
+            else:
+                # The relation is decided, so the program is never executed
+                results.extend(test_relations([relation], None, log=lambda message: None, analyser=analyser)[0])
+
+        if any(result is None for result in results):
+            return EXECUTE, results
+        return (KILLED if get_failures(results) else SURVIVED), results
+
+
+def write_execute_config(config_path: str, classifications: list, outfile_path: str):
+    """Write a copy of a mutation configuration that only lists the mutants that must be executed.
+
+    :param config_path: Path to the cosmic-ray mutation configuration.
+    :param classifications: The classification of each mutation listed in the configuration, in order.
+    :param outfile_path: Path to write the reduced configuration to.
+    """
+    with open(config_path) as config_file:
+        config = tomlkit.load(config_file)
+    classifications = iter(classifications)
+    for operator in config["cosmic-ray"]["operators"]:
+        executed_args = tomlkit.array()
+        for args in operator["args"]:
+            if next(classifications) == EXECUTE:
+                executed_args.append(args)
+        operator["args"] = executed_args
+    with open(outfile_path, "w") as outfile:
+        tomlkit.dump(config, outfile)
+
+
+def _get_block_sources(source: str, output_blocks: dict) -> dict:
+    """Get the source code of the block that computes each output of a generated program."""
+    lines = source.splitlines()
+    return {output: "\n".join(lines[block.lineno - 1:block.end_lineno]) for output, block in output_blocks.items()}
@@ -0,0 +1,308 @@
+"""An in-process mutation testing engine for the causal mutations listed in a cosmic-ray TOML configuration.
+
+Rather than writing each mutant to disk and testing it in a fresh process, every mutant of the program is compiled into
+a single meta-program (a mutant schema). The body of each output's `if Y is None:` block becomes a switch over the
+global __mutant__, whose branches contain the mutated versions of that block and whose default branch contains the
+original. The metamorphic relations and tests are generated once, and each mutant is then selected and tested
+in-process.
+
+The mutations follow the intent of the cosmic-ray operators listed by generate_causal_mutation_config:
+    - core/VariableReplacer deletes the edge cause --> effect by replacing every use of the cause in the effect's block
+      (including any predicate) with the constant 0.
+    - core/VariableInserter adds the edge cause --> effect by adding the cause to every assignment of the effect.
+
+Unlike cosmic-ray, each operator argument produces exactly one mutant, which is applied at every position in the effect's
+block. The results are written in the format produced by result_cleanup.py, so they can be processed by
+process_seed_results.py. Mutants that crash the program are recorded with the outcome "crashed" and no failed relations.
+"""
+import argparse
+import ast
+import copy
+import difflib
+import json
+import os
+import uuid
+from collections import namedtuple
+from typing import List
+import tomlkit
+from programs.program_analysis import (get_program_function, get_output_blocks, get_program_dependency_graph,
+                                       get_affected_outputs)
+from programs.program_execution import SlicedProgram
+from mutation_testing.equivalent_mutants import MutantClassifier, write_execute_config, EQUIVALENT, EXECUTE
+from programs.program_testing import iter_relations_with_tests, test_relations, test_affected_relations, get_failures
+from dags.dag_utils import load_dag
+
+Mutation = namedtuple("Mutation", ["operator", "cause_variable", "effect_variable"])
+
+MUTANT_SELECTOR = "__mutant__"
+VARIABLE_REPLACER = "core/VariableReplacer"
+VARIABLE_INSERTER = "core/VariableInserter"
+
+
+def read_mutations(config_path: str) -> List[Mutation]:
+    """Read the causal mutations listed in a cosmic-ray TOML configuration.
+
+    :param config_path: Path to a configuration written by generate_causal_mutation_config.
+    :return: A list of mutations, in the order they are listed.
+    """
+    with open(config_path) as config_file:
+        config = tomlkit.load(config_file)
+    mutations = []
+    for operator in config["cosmic-ray"]["operators"]:
+        for args in operator["args"]:
+            mutations.append(Mutation(str(operator["name"]), str(args["cause_variable"]),
+                                      str(args["effect_variable"])))
+    return mutations
+
+
+class _VariableReplacer(ast.NodeTransformer):
+    """Replace every use of a variable with the constant 0."""
+
+    def __init__(self, variable: str):
+        self.variable = variable
+
+    def visit_Name(self, node: ast.Name):
+        if node.id == self.variable and isinstance(node.ctx, ast.Load):
+            return ast.copy_location(ast.Constant(0), node)
+        return node
+
+
+class _VariableInserter(ast.NodeTransformer):
+    """Add a variable to the value of every assignment to a given target."""
+
+    def __init__(self, variable: str, target: str):
+        self.variable = variable
+        self.target = target
+
+    def visit_Assign(self, node: ast.Assign):
+        if any(isinstance(target, ast.Name) and target.id == self.target for target in node.targets):
+            node.value = ast.BinOp(left=node.value, op=ast.Add(), right=ast.Name(self.variable, ast.Load()))
+        return node
+
+
+def mutate_block(block: ast.If, mutation: Mutation):
+    """Apply a mutation to the body of an output's block.
+
+    :param block: The `if Y is None:` block of the mutation's effect variable.
+    :param mutation: The mutation to apply.
+    :return: The mutated body (a list of statements), or None if the mutation does not change the block.
+    """
+    body = [copy.deepcopy(statement) for statement in block.body]
+    if mutation.operator == VARIABLE_REPLACER:
+        transformer = _VariableReplacer(mutation.cause_variable)
+    elif mutation.operator == VARIABLE_INSERTER:
+        transformer = _VariableInserter(mutation.cause_variable, mutation.effect_variable)
+    else:
+        raise ValueError(f"Unsupported mutation operator {mutation.operator}.")
+    mutated_body = [ast.fix_missing_locations(transformer.visit(statement)) for statement in body]
+    if ast.dump(ast.Module(mutated_body, [])) == ast.dump(ast.Module(block.body, [])):
+        return None
+    return mutated_body
+
+
+def build_mutant_schema(source: str, mutations: List[Mutation], program_name: str = "program"):
+    """Compile every mutant of a generated program into a single meta-program.
+
+    :param source: The source code of the generated program.
+    :param mutations: The mutations to include.
+    :param program_name: The name of the function under test.
+    :return: The source of the meta-program and a dictionary mapping the position of each applicable mutation to the
+             source of the corresponding mutant. Mutations that do not change the program are omitted.
+    """
+    module = ast.parse(source)
+    output_blocks = get_output_blocks(get_program_function(module, program_name))
+
+    mutant_bodies = {}
+    for mutation_position, mutation in enumerate(mutations):
+        block = output_blocks.get(mutation.effect_variable)
+        mutated_body = mutate_block(block, mutation) if block is not None else None
+        if mutated_body is not None:
+            mutant_bodies[mutation_position] = (block, mutated_body)
+
+    # Render each mutant on its own, for its diff against the original program
+    mutant_sources = {}
+    for mutation_position, (block, mutated_body) in mutant_bodies.items():
+        original_body = block.body
+        block.body = mutated_body
+        mutant_sources[mutation_position] = ast.unparse(module)
+        block.body = original_body
+
+    # Replace the body of each mutated block with a switch over the selected mutant
+    for block in output_blocks.values():
+        switch = block.body
+        for mutation_position, (mutated_block, mutated_body) in reversed(list(mutant_bodies.items())):
+            if mutated_block is block:
+                selector = ast.parse(f"{MUTANT_SELECTOR} == {mutation_position}", mode="eval").body
+                switch = [ast.If(test=selector, body=mutated_body, orelse=switch)]
+        block.body = switch
+
+    module.body.insert(0, ast.parse(f"{MUTANT_SELECTOR} = None").body[0])
+    return ast.unparse(ast.fix_missing_locations(module)), mutant_sources
+
+
+def run_mutants(program_path: str, dag_path: str, config_path: str, seed: int = 0, sample_size: int = 1,
+                program_name: str = "program", select_tests: bool = False, slice_program: bool = False,
+                prepass: bool = False, execute_config_path: str = None) -> dict:
+    """Test every mutant listed in a mutation configuration in-process.
+
+    :param program_path: Path to the generated program.
+    :param dag_path: Path to the causal DAG used to generate the metamorphic relations.
+    :param config_path: Path to the cosmic-ray mutation configuration.
+    :param seed: A random seed for reproducibility.
+    :param sample_size: Number of tests to generate per relation.
+    :param program_name: The name of the function under test.
+    :param select_tests: Whether to only test the relations whose output can be affected by each mutant, reusing the
+                         baseline verdicts of the rest.
+    :param slice_program: Whether each relation should only execute the slice of the meta-program that computes its
+                          output.
+    :param prepass: Whether to classify each mutant before executing it (see mutation_testing/equivalent_mutants.py).
+                    Only mutants classified as "execute" are executed, against the relations that the pre-pass could
+                    not decide, and each job records its classification as "prepass". This implies select_tests.
+    :param execute_config_path: If given (with prepass), a copy of the mutation configuration that only lists the
+                                mutants classified as "execute" is written to this path.
+    :return: A dictionary of results keyed by job, in the format written by result_cleanup.py.
+    """
+    with open(program_path) as program_file:
+        source = program_file.read()
+    mutations = read_mutations(config_path)
+    schema_source, mutant_sources = build_mutant_schema(source, mutations, program_name)
+    namespace = {"__name__": "program.program"}
+    if slice_program:
+        program = SlicedProgram(schema_source, program_name, namespace)
+    else:
+        exec(compile(schema_source, f"{program_path}:schema", "exec"), namespace)
+        program = namespace[program_name]
+
+    relations = list(iter_relations_with_tests(load_dag(dag_path), seed=seed, sample_size=sample_size))
+    baseline_results, _ = test_relations(relations, program, log=lambda message: None)
+    results = {"baseline": {
+        "total_tests": sum(result["total"] for result in baseline_results),
+        "n_tests": baseline_results[0]["total"] if baseline_results else 0,
+        "total_relations": len(baseline_results),
+        "failed_relations": get_failures(baseline_results)
+    }}
+
+    baseline_results_by_relation = {result["relation"]: result for result in baseline_results}
+    dependency_graph = get_program_dependency_graph(source, program_name)
+
+    original_source = ast.unparse(ast.parse(source))
+    if prepass:
+        classifier = MutantClassifier(source, relations, baseline_results, program_name)
+    classifications = [EQUIVALENT] * len(mutations)  # Mutations that do not change the program are equivalent
+    for mutation_position, mutant_source in mutant_sources.items():
+        mutation = mutations[mutation_position]
+        namespace[MUTANT_SELECTOR] = mutation_position
+        classification = classifications[mutation_position] = EXECUTE
+        mutant_results = None
+        if prepass:
+            try:
+                classification, mutant_results = classifier.classify(mutant_source)
+            except Exception:
+                # A mutant that crashes the pre-pass must be executed, against every relation it can affect
+                classification, mutant_results = EXECUTE, None
+            classifications[mutation_position] = classification
+        try:
+            if mutant_results is not None:
+                # Only execute the relations that the pre-pass could not decide
+                pending = [position for position, result in enumerate(mutant_results) if result is None]
+                executed_results, _ = test_relations([relations[position] for position in pending], program,
+                                                     log=lambda message: None)
+                for position, result in zip(pending, executed_results):
+                    mutant_results[position] = result
+            elif select_tests or prepass:
+                affected_outputs = get_affected_outputs(dependency_graph, mutation.effect_variable)
+                mutant_results, _, _ = test_affected_relations(relations, program, affected_outputs,
+                                                               baseline_results_by_relation,
+                                                               log=lambda message: None)
+            else:
+                mutant_results, _ = test_relations(relations, program, log=lambda message: None)
+            failed_relations = get_failures(mutant_results)
+            outcome = "killed" if failed_relations else "survived"
+        except Exception:
+            # A mutant that crashes the program has no oracle verdicts, so no relation is recorded as failed
+            failed_relations = []
+            outcome = "crashed"
+        job = results[uuid.uuid4().hex] = {
+            "operator": mutation.operator,
+            "args": json.dumps({"cause_variable": mutation.cause_variable,
+                                "effect_variable": mutation.effect_variable}),
+            "outcome": outcome,
+            "diff": "\n".join(difflib.unified_diff(original_source.splitlines(), mutant_source.splitlines(),
+                                                   fromfile=program_path, tofile=program_path, lineterm="")),
+            "failed_relations": failed_relations
+        }
+        if prepass:
+            job["prepass"] = classification
+    namespace[MUTANT_SELECTOR] = None
+
+    if prepass and execute_config_path is not None:
+        write_execute_config(config_path, classifications, execute_config_path)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parses args"
+    )
+    parser.add_argument('-p',
+                        '--program',
+                        help="Path to program file.",
+                        required=True,
+                        )
+    parser.add_argument('-d',
+                        '--dag',
+                        help="Path to causal dag.",
+                        required=True,
+                        )
+    parser.add_argument('-c',
+                        '--config',
+                        help="Path to the mutation configuration (TOML).",
+                        required=True,
+                        )
+    parser.add_argument('-s',
+                        '--seed',
+                        help="A random seed for reproducibility. Defaults to 0.",
+                        required=False,
+                        type=int,
+                        default=0)
+    parser.add_argument('-t',
+                        '--tests',
+                        help="Number of tests to generate per relation.",
+                        required=False,
+                        type=int,
+                        default=1)
+    parser.add_argument('-o',
+                        '--outfile',
+                        help="A location to save the results.",
+                        required=True,
+                        )
+    parser.add_argument('--select',
+                        help="Only test the relations whose output can be affected by each mutant, reusing the "
+                             "baseline verdicts of the rest.",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        )
+    parser.add_argument('--slice',
+                        help="Execute only the slice of the meta-program that computes the output of each relation.",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        )
+    parser.add_argument('--prepass',
+                        help="Classify each mutant as equivalent, killed, survived or execute before executing it, "
+                             "and only execute the relations of the last group that cannot be decided.",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        )
+    parser.add_argument('--execute-config',
+                        help="With --prepass, a location to save a copy of the mutation configuration that only lists "
+                             "the mutants that must be executed.",
+                        required=False,
+                        )
+    args = parser.parse_args()
+    mutant_results = run_mutants(args.program, args.dag, args.config, seed=args.seed, sample_size=args.tests,
+                                 select_tests=args.select, slice_program=args.slice, prepass=args.prepass,
+                                 execute_config_path=args.execute_config)
+    os.makedirs(os.path.dirname(os.path.abspath(args.outfile)), exist_ok=True)
+    with open(args.outfile, 'w') as f:
+        print(json.dumps(mutant_results), file=f)
+    print(f"Tested {len(mutant_results) - 1} mutants.")
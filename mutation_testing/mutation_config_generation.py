@@ -4,13 +4,26 @@ import tomlkit
 from tomlkit import aot, inline_table, nl, table, document, array
 from helpers import safe_open_w
 from dags.dag_utils import get_non_causal_node_pairs
+from dags.dag_index import CausalDAGIndex
 
 
-def generate_causal_mutation_config(dag: nx.DiGraph, target_directory_path: str):
+def generate_causal_mutation_config(dag: nx.DiGraph, target_directory_path: str, test_server_address: str = None,
+                                    distributor: str = "local", workers: int = None, job_timeout: float = None,
+                                    index: CausalDAGIndex = None):
     """Generate a TOML configuration file listing causal mutations for the specified causal DAG.
 
     :param dag: A networkx directed graph representing a causal DAG.
     :param target_directory_path: The path to which the mutation config will be saved.
+    :param test_server_address: An optional address (host:port or a unix socket path) of a running
+                                programs/program_test_server.py. If given, the test-command sends each mutant to this
+                                server instead of starting programs/program_testing.py afresh.
+    :param distributor: The distributor used to execute the mutation jobs. This is either "local", which executes the
+                        jobs one after another, or "pool", which executes them in parallel using
+                        mutation_testing/pool_distributor.py.
+    :param workers: The number of worker processes used by the "pool" distributor. Defaults to the number of CPUs.
+    :param job_timeout: The timeout (in seconds) of each job executed by the "pool" distributor. Defaults to the
+                        cosmic-ray timeout.
+    :param index: An optional CausalDAGIndex of the DAG, which can be built once and shared between configurations.
     """
     edge_deletion_mutations = []
 
@@ -20,7 +33,7 @@ def generate_causal_mutation_config(dag: nx.DiGraph, target_directory_path: str)
                                         'effect_variable': effect_variable})
 
     edge_addition_mutations = []
-    non_causal_node_pairs = get_non_causal_node_pairs(dag)
+    non_causal_node_pairs = get_non_causal_node_pairs(dag, index)
     for non_causal_node_pair in non_causal_node_pairs:
         cause_variable, effect_variable = non_causal_node_pair
         edge_addition_mutations.append({'cause_variable': cause_variable,
@@ -33,13 +46,24 @@ def generate_causal_mutation_config(dag: nx.DiGraph, target_directory_path: str)
     cosmic_ray_table.add("module-path", "./program.py")
     cosmic_ray_table.add("timeout", 20.0)
     cosmic_ray_table.add("excluded-modules", [])
-    cosmic_ray_table.add("test-command", "python ../../../../../../programs/program_testing.py -p ./program.py -d ../DAG.dot -c -t 1")
+    if test_server_address:
+        cosmic_ray_table.add("test-command", f"python ../../../../../../programs/program_test_client.py "
+                                             f"-a {test_server_address} -p ./program.py -d ../DAG.dot -c -t 1")
+    else:
+        cosmic_ray_table.add("test-command", "python ../../../../../../programs/program_testing.py -p ./program.py -d ../DAG.dot -c -t 1")
     toml_document.add("cosmic-ray", cosmic_ray_table)
     toml_document.add(nl())
 
     # Add distributor table
     distributor_table = table()
-    distributor_table.add("name", "local")
+    distributor_table.add("name", distributor)
+    if distributor == "pool":
+        pool_table = table()
+        if workers is not None:
+            pool_table.add("workers", workers)
+        if job_timeout is not None:
+            pool_table.add("timeout", job_timeout)
+        distributor_table.add("pool", pool_table)
     cosmic_ray_table.add("distributor", distributor_table)
     toml_document.add(nl())
 
@@ -0,0 +1,125 @@
+"""A cosmic-ray distributor that executes mutation jobs in parallel using a local pool of worker processes.
+
+cosmic-ray's "local" distributor mutates the module in place and runs the test-command for one job at a time. This
+distributor gives each worker process its own copy of the working directory, so that several mutants can be tested at
+once, while the results of every job are written to the same session database by the parent process.
+
+Each copy is created alongside the working directory (i.e. in the same parent directory) so that the relative paths in
+the test-command (e.g. ../DAG.dot) resolve to the same files. Any JSON files the test-command writes to a copy (e.g. the
+results written with -o) are copied back to the working directory before the copies are removed. The distributor is configured in the mutation config:
+
+    [cosmic-ray.distributor]
+    name = "pool"
+
+    [cosmic-ray.distributor.pool]
+    workers = 8  # Defaults to the number of CPUs
+    timeout = 20.0  # Per-job timeout in seconds. Defaults to the cosmic-ray timeout.
+
+Since cosmic-ray only discovers distributors registered as plugins, jobs for a "pool" configuration are executed with
+this script in place of `cosmic-ray exec`, and the baseline is run by `cosmic-ray baseline` with a copy of the
+configuration that uses the "local" distributor (run.sh does both automatically):
+
+    python mutation_testing/pool_distributor.py mutation_config.toml mutation_config.sqlite
+"""
+import argparse
+import asyncio
+import glob
+import os
+import shutil
+import time
+import tomlkit
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Queue
+from cosmic_ray.mutating import mutate_and_test
+from cosmic_ray.work_db import use_db, WorkDB
+
+
+def _initialise_worker(worker_directories: Queue):
+    """Move a new worker process into a working directory of its own."""
+    os.chdir(worker_directories.get())
+
+
+def _execute_work_item(work_item, test_command: str, timeout: float):
+    """Mutate the worker's copy of the module and run the test-command against it.
+
+    mutate_and_test is a coroutine function (as awaited by cosmic-ray's local distributor), so each work item is run
+    to completion in an event loop of the worker's own.
+    """
+    return work_item.job_id, asyncio.run(mutate_and_test(mutations=work_item.mutations, test_command=test_command,
+                                                         timeout=timeout))
+
+
+def _copy_written_json_files(worker_directory: str, working_directory: str, since: float):
+    """Copy the JSON files written to a worker's directory since the given time back to the working directory."""
+    for json_path in glob.glob(os.path.join(worker_directory, "*.json")):
+        if os.path.getmtime(json_path) >= since:
+            shutil.copy2(json_path, working_directory)
+
+
+class PoolDistributor:
+    """Execute mutation jobs in parallel, following the interface of cosmic-ray's distributors."""
+
+    def __call__(self, pending_work, test_command: str, timeout: float, distributor_config: dict, on_task_complete):
+        """Execute the pending work items.
+
+        :param pending_work: An iterable of cosmic-ray work items.
+        :param test_command: The command used to test each mutant.
+        :param timeout: The cosmic-ray timeout (in seconds), used if distributor_config does not specify one.
+        :param distributor_config: The [cosmic-ray.distributor.pool] table of the mutation config.
+        :param on_task_complete: A function called with the job ID and result of each completed work item.
+        """
+        pending_work = list(pending_work)
+        if not pending_work:
+            return
+        workers = min(int(distributor_config.get("workers", os.cpu_count() or 1)), len(pending_work))
+        timeout = float(distributor_config.get("timeout", timeout))
+
+        working_directory = os.getcwd()
+        start_time = time.time()
+        worker_directories = [f"{working_directory}.worker{worker}" for worker in range(workers)]
+        worker_directory_queue = Queue()
+        for worker_directory in worker_directories:
+            shutil.copytree(working_directory, worker_directory,
+                            ignore=shutil.ignore_patterns("*.sqlite", "*.sqlite-journal"), dirs_exist_ok=True)
+            worker_directory_queue.put(worker_directory)
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_initialise_worker,
+                                     initargs=(worker_directory_queue,)) as executor:
+                futures = [executor.submit(_execute_work_item, work_item, test_command, timeout)
+                           for work_item in pending_work]
+                for future in as_completed(futures):
+                    on_task_complete(*future.result())
+        finally:
+            for worker_directory in worker_directories:
+                _copy_written_json_files(worker_directory, working_directory, start_time)
+                shutil.rmtree(worker_directory, ignore_errors=True)
+
+
+def execute(config_path: str, session_path: str):
+    """Execute the pending jobs of a cosmic-ray session using the pool distributor.
+
+    :param config_path: Path to the mutation config.
+    :param session_path: Path to the session database created by `cosmic-ray init`.
+    """
+    with open(config_path) as config_file:
+        config = tomlkit.load(config_file)["cosmic-ray"]
+    distributor_config = config.get("distributor", {}).get("pool", {})
+
+    with use_db(session_path, mode=WorkDB.Mode.open) as work_db:
+        PoolDistributor()(work_db.pending_work_items, str(config["test-command"]), float(config["timeout"]),
+                          distributor_config, on_task_complete=work_db.set_result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parses args"
+    )
+    parser.add_argument('config',
+                        help="Path to the mutation config (TOML).",
+                        )
+    parser.add_argument('session',
+                        help="Path to the session database (sqlite file).",
+                        )
+    args = parser.parse_args()
+    execute(args.config, args.session)
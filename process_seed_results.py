@@ -1,9 +1,9 @@
 import json
 import argparse
 import os
-import pydot
 import mccabe as mc
 import ast
+from dags.dag_utils import load_dag_metadata
 
 
 def get_mccabe_complexity(program_path):
@@ -60,10 +60,9 @@ for dag in dags:
 
     with open(os.path.join(dags_dir, dag, args.results)) as f:
         results = json.load(f)
-    graph = pydot.graph_from_dot_file(os.path.join(dags_dir, dag, "DAG.dot"))[0]
-    datum['dag_nodes'] = len(graph.get_nodes())
-    datum['dag_edges'] = len(graph.get_edges())
-    comment = json.loads(json.loads(graph.get_comment()))
+    comment = load_dag_metadata(os.path.join(dags_dir, dag, "DAG.dot"))
+    datum['dag_nodes'] = comment["n_nodes"]
+    datum['dag_edges'] = comment["n_edges"]
 
     if dag == "original_dag":
         p_conditional = comment["p_conditional"]
@@ -78,6 +77,12 @@ for dag in dags:
     datum["p_edge"] = p_edge
     datum["p_invert_edge"] = p_invert_edge
     datum["structural_hamming_distance"] = structural_hamming_distance
+    relation_diff_path = os.path.join(dags_dir, dag, "relation_diff.json")
+    if os.path.exists(relation_diff_path):
+        with open(relation_diff_path) as f:
+            datum["changed_relations"] = len(json.load(f)["changed"])
+    elif dag == "original_dag":
+        datum["changed_relations"] = 0
 
     # total_tests = sum([relation["total"] for relation in results["baseline"]["test_outcomes"]])
     datum["total_tests"] = results["baseline"]["total_tests"]
@@ -99,6 +104,10 @@ for dag in dags:
     for job in results:
         if job == "baseline":
             continue
+        if results[job].get("outcome") == "crashed":
+            # A mutant that crashes the program has no oracle verdicts to count
+            datum["jobs"][job]["crashed"] = True
+            continue
 
         # Positive
         # failed_tests = [tuple(sorted(list(test["source_inputs"].items()))) for relation in results[job]["test_outcomes"] for test in relation["failures"]]
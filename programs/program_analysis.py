@@ -0,0 +1,320 @@
+"""Static analysis of the programs written by programs/program_generation.py."""
+import ast
+import networkx as nx
+from collections import ChainMap
+from metamorphic_relations.metamorphic_relation import InputDomains
+
+
+def get_program_function(module: ast.Module, program_name: str = "program") -> ast.FunctionDef:
+    """Get the definition of the function under test from a parsed program.
+
+    :param module: The parsed program.
+    :param program_name: The name of the function under test.
+    :return: The function definition.
+    """
+    return next(node for node in module.body if isinstance(node, ast.FunctionDef) and node.name == program_name)
+
+
+def get_output_blocks(function: ast.FunctionDef) -> dict:
+    """Get the `if Y is None:` block that computes each output of a generated program.
+
+    :param function: The function definition of the generated program.
+    :return: A dictionary mapping output names to their if statements, in the order they are computed.
+    """
+    output_blocks = {}
+    for statement in function.body:
+        if (isinstance(statement, ast.If) and isinstance(statement.test, ast.Compare)
+                and isinstance(statement.test.left, ast.Name) and isinstance(statement.test.ops[0], ast.Is)):
+            output_blocks[statement.test.left.id] = statement
+    return output_blocks
+
+
+def get_program_dependency_graph(source: str, program_name: str = "program") -> nx.DiGraph:
+    """Get the graph of data dependencies between the variables of a generated program.
+
+    There is an edge from each variable read by the block that computes an output to that output. Unlike the DAG the
+    program was generated from, this reflects the program as it is, e.g. after it has been mutated.
+
+    :param source: The source code of the generated program.
+    :param program_name: The name of the function under test.
+    :return: A networkx directed graph whose nodes are the arguments of the program.
+    """
+    function = get_program_function(ast.parse(source), program_name)
+    dependency_graph = nx.DiGraph()
+    dependency_graph.add_nodes_from(argument.arg for argument in function.args.args)
+    for output, block in get_output_blocks(function).items():
+        dependency_graph.add_edges_from((parent, output) for parent in get_block_dependencies(output, block))
+    return dependency_graph
+
+
+def get_block_dependencies(output: str, block: ast.If) -> set:
+    """Get the variables read by the block that computes an output of a generated program.
+
+    :param output: The output computed by the block.
+    :param block: The `if Y is None:` block that computes the output.
+    :return: The set of variables read by the block, excluding the output itself.
+    """
+    return {node.id for statement in block.body for node in ast.walk(statement)
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id != output}
+
+
+def get_affected_outputs(dependency_graph: nx.DiGraph, effect_variable: str) -> set:
+    """Get the outputs whose values can change when the computation of an output is mutated.
+
+    :param dependency_graph: The dependency graph of the program.
+    :param effect_variable: The output whose computation is mutated.
+    :return: The set containing the effect variable and its descendants.
+    """
+    return nx.descendants(dependency_graph, effect_variable) | {effect_variable}
+
+
+class SymbolicAnalyser:
+    """Decide whether the output of a metamorphic relation changes under its intervention without executing the program.
+
+    Each output of a generated program is a linear expression of its parents, possibly selected by a threshold predicate
+    on a sum of parents. Given the variables that are fixed by a relation's tests, each output is reduced to an affine
+    function of atoms: the inputs, the fixed outputs, and any conditional output whose value does not depend on the
+    relation's input variable. Each atom ranges over an interval (the test domain for inputs and fixed outputs), so a
+    predicate can be decided for every test if it holds (or fails) over the whole box of atom values.
+
+    If the output reduces to an affine function, its coefficient on the input variable is exact: the output changes in
+    every test if the coefficient is non-zero (since the source and follow-up values of the input always differ), and
+    in none otherwise. If a predicate on which the output depends cannot be decided, neither can the output.
+
+    :param source: The source code of the generated program.
+    :param program_name: The name of the function under test.
+    :param domains: The domains of the values assigned to inputs and fixed outputs by the tests (see
+                    metamorphic_relations.metamorphic_relation.InputDomains). Defaults to [-10, 10] for every variable.
+    """
+
+    def __init__(self, source: str, program_name: str = "program", domains: InputDomains = None):
+        self.output_blocks = get_output_blocks(get_program_function(ast.parse(source), program_name))
+        self.dependency_graph = get_program_dependency_graph(source, program_name)
+        self.domains = InputDomains() if domains is None else domains
+        self.base = None
+        self.affected_outputs = set()
+        self.cones = {}
+        self.analyses = {}
+        self.decided = 0
+        self.undecided = 0
+
+    def mutate(self, changed_blocks: dict) -> "SymbolicAnalyser":
+        """Get an analyser for a mutant of the program.
+
+        The outputs that the mutant cannot affect (i.e. that do not descend from a changed block) have the same values as
+        in the program, so their analyses are shared with this analyser rather than repeated.
+
+        :param changed_blocks: A dictionary mapping each output whose computation is mutated to the mutated `if Y is
+                               None:` block.
+        :return: The analyser for the mutant.
+        """
+        mutant = SymbolicAnalyser.__new__(SymbolicAnalyser)
+        mutant.output_blocks = {output: changed_blocks.get(output, block) for output, block in self.output_blocks.items()}
+        mutant.dependency_graph = self.dependency_graph.copy()
+        for output, block in changed_blocks.items():
+            mutant.dependency_graph.remove_edges_from(list(mutant.dependency_graph.in_edges(output)))
+            mutant.dependency_graph.add_edges_from((parent, output) for parent in get_block_dependencies(output, block))
+        mutant.domains = self.domains
+        mutant.base = self
+        mutant.affected_outputs = set()
+        for output in changed_blocks:
+            mutant.affected_outputs |= get_affected_outputs(mutant.dependency_graph, output)
+        mutant.cones = {}
+        mutant.analyses = {}
+        mutant.decided = 0
+        mutant.undecided = 0
+        return mutant
+
+    def output_changes(self, input_var: str, output_var: str, fixed_variables) -> bool:
+        """Decide whether an output changes when intervening on an input variable, fixing a set of variables.
+
+        :param input_var: The variable that is intervened upon.
+        :param output_var: The variable that is observed.
+        :param fixed_variables: The outputs whose values are fixed by the tests (e.g. the adjustment list).
+        :return: True if the output changes in every test, False if it changes in none, or None if this cannot be
+                 decided symbolically.
+        """
+        value = self._reduce(input_var, frozenset(fixed_variables), output_var)
+        if value is None:
+            self.undecided += 1
+            return None
+        self.decided += 1
+        coefficients, _ = value
+        return coefficients.get(input_var, 0) != 0
+
+    def _cone(self, output_var: str) -> list:
+        """Get the outputs that must be reduced to reduce an output, in the order they are computed."""
+        if output_var not in self.cones:
+            ancestors = nx.ancestors(self.dependency_graph, output_var) | {output_var}
+            self.cones[output_var] = [output for output in self.output_blocks if output in ancestors]
+        return self.cones[output_var]
+
+    def _analysis(self, input_var: str, fixed_variables: frozenset) -> tuple:
+        """Get the values reduced so far and the intervals of their atoms for an input variable and fixed variables."""
+        key = (input_var, fixed_variables)
+        if key not in self.analyses:
+            # The intervals of the atoms of values shared with the base analyser are looked up in its analysis
+            intervals = {} if self.base is None else ChainMap({}, self.base._analysis(input_var, fixed_variables)[1])
+            self.analyses[key] = ({}, intervals)
+        return self.analyses[key]
+
+    def _reduce(self, input_var: str, fixed_variables: frozenset, output_var: str):
+        """Reduce an output to an affine function of atoms, or None if it cannot be decided.
+
+        Only the outputs in the cone of the output are reduced, and each is reduced at most once per input variable and
+        set of fixed variables.
+        """
+        if output_var not in self.output_blocks:
+            return None
+        values, intervals = self._analysis(input_var, fixed_variables)
+        if output_var in values:
+            return values[output_var]
+
+        def atom(name, interval):
+            intervals[name] = interval
+            return {name: 1}, 0
+
+        def lookup(name):
+            if name not in values and name not in self.output_blocks:
+                values[name] = atom(name, self.domains[name])  # An input
+            return values.get(name)
+
+        def decide(difference, operator):
+            """Decide a comparison over the whole box of atom values, returning True, False, or None."""
+            lower, upper = _interval(difference, intervals)
+            if isinstance(operator, ast.LtE):
+                return True if upper <= 0 else False if lower > 0 else None
+            if isinstance(operator, ast.Lt):
+                return True if upper < 0 else False if lower >= 0 else None
+            if isinstance(operator, ast.GtE):
+                return True if lower >= 0 else False if upper < 0 else None
+            return True if lower > 0 else False if upper <= 0 else None
+
+        def execute(statements):
+            """Evaluate the assignment in a branch, returning its affine function, or None."""
+            if len(statements) == 1 and isinstance(statements[0], ast.Assign):
+                return _to_affine(statements[0].value, lookup)
+            if len(statements) == 1 and isinstance(statements[0], ast.If):
+                difference, operator = _to_comparison(statements[0].test, lookup)
+                if difference is None:
+                    return None
+                branch = decide(difference, operator)
+                if branch is not None:
+                    return execute(statements[0].body if branch else statements[0].orelse)
+                # The branch taken can differ between tests, so the value is only known if it cannot differ between
+                # the source and follow-up runs of a test, in which case it is an atom
+                branches = [execute(statements[0].body), execute(statements[0].orelse)]
+                if input_var in difference[0] or any(value is None or input_var in value[0] for value in branches):
+                    return None
+                branch_intervals = [_interval(value, intervals) for value in branches]
+                return atom(object(), (min(interval[0] for interval in branch_intervals),
+                                       max(interval[1] for interval in branch_intervals)))
+            return None
+
+        for output in self._cone(output_var):
+            if output in values:
+                continue
+            if output == input_var or output in fixed_variables:
+                values[output] = atom(output, self.domains[output])
+            elif self.base is not None and output not in self.affected_outputs:
+                values[output] = self.base._reduce(input_var, fixed_variables, output)
+            else:
+                values[output] = execute(self.output_blocks[output].body)
+        return values[output_var]
+
+
+def blocks_equivalent(statements: list, other_statements: list) -> bool:
+    """Whether two blocks of a generated program compute the same value for every value of the variables they read.
+
+    Both blocks must either be a single linear assignment, or an if statement whose predicates are equivalent and whose
+    branches are pairwise equivalent. Anything else is conservatively considered not equivalent.
+
+    :param statements: The statements of a block.
+    :param other_statements: The statements of another block.
+    :return: True if the blocks are provably equivalent, False otherwise.
+    """
+    if len(statements) != 1 or len(other_statements) != 1:
+        return False
+    statement, other_statement = statements[0], other_statements[0]
+
+    def lookup(name):
+        return {name: 1}, 0
+
+    if isinstance(statement, ast.Assign) and isinstance(other_statement, ast.Assign):
+        value = _to_affine(statement.value, lookup)
+        return value is not None and value == _to_affine(other_statement.value, lookup)
+    if isinstance(statement, ast.If) and isinstance(other_statement, ast.If):
+        difference, operator = _to_comparison(statement.test, lookup)
+        other_difference, other_operator = _to_comparison(other_statement.test, lookup)
+        return (difference is not None and difference == other_difference and type(operator) is type(other_operator)
+                and blocks_equivalent(statement.body, other_statement.body)
+                and blocks_equivalent(statement.orelse, other_statement.orelse))
+    return False
+
+
+def _to_affine(node, lookup):
+    """Evaluate an expression to an affine function, returned as (coefficients, constant), or None.
+
+    :param node: The expression.
+    :param lookup: A function that returns the affine function of a variable (or None) given its name.
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, int):
+        return {}, node.value
+    if isinstance(node, ast.Name):
+        return lookup(node.id)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        operand = _to_affine(node.operand, lookup)
+        return operand if operand is None or isinstance(node.op, ast.UAdd) else _scale(operand, -1)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult)):
+        left, right = _to_affine(node.left, lookup), _to_affine(node.right, lookup)
+        if left is None or right is None:
+            return None
+        if isinstance(node.op, ast.Add):
+            return _add(left, right)
+        if isinstance(node.op, ast.Sub):
+            return _add(left, _scale(right, -1))
+        if not left[0]:
+            return _scale(right, left[1])
+        if not right[0]:
+            return _scale(left, right[1])
+    return None
+
+
+def _to_comparison(predicate, lookup):
+    """Reduce a predicate to an affine function compared with 0, returned with the comparison operator (or None)."""
+    if not (isinstance(predicate, ast.Compare) and len(predicate.ops) == 1
+            and isinstance(predicate.ops[0], (ast.LtE, ast.GtE, ast.Lt, ast.Gt))):
+        return None, None
+    left, right = _to_affine(predicate.left, lookup), _to_affine(predicate.comparators[0], lookup)
+    if left is None or right is None:
+        return None, None
+    return _add(left, _scale(right, -1)), predicate.ops[0]
+
+
+def _add(left, right):
+    """Add two affine functions."""
+    coefficients = dict(left[0])
+    for name, coefficient in right[0].items():
+        coefficients[name] = coefficients.get(name, 0) + coefficient
+        if coefficients[name] == 0:
+            del coefficients[name]
+    return coefficients, left[1] + right[1]
+
+
+def _scale(value, factor):
+    """Multiply an affine function by a constant."""
+    if factor == 0:
+        return {}, 0
+    return {name: coefficient * factor for name, coefficient in value[0].items()}, value[1] * factor
+
+
+def _interval(value, intervals):
+    """Get the (lower, upper) bounds of an affine function given the intervals of its atoms."""
+    lower = upper = value[1]
+    for name, coefficient in value[0].items():
+        atom_lower, atom_upper = intervals[name]
+        if coefficient > 0:
+            lower, upper = lower + coefficient * atom_lower, upper + coefficient * atom_upper
+        else:
+            lower, upper = lower + coefficient * atom_upper, upper + coefficient * atom_lower
+    return lower, upper
@@ -0,0 +1,195 @@
+"""Helpers for executing programs under test."""
+import ast
+import copy
+import networkx as nx
+from collections import OrderedDict
+from programs.program_analysis import get_program_function, get_output_blocks, get_program_dependency_graph
+
+
+class MemoisedProgram:
+    """Wrap a program under test with a bounded least-recently-used (LRU) cache of its outputs.
+
+    Many metamorphic relations over the same DAG call the program on identical inputs, so a single memoised program
+    should be shared by all relations of a run. The cache is keyed by the inputs sorted by name, and the hits and
+    misses are counted.
+
+    Note that cached outputs are returned as is (i.e. the same dict is returned for repeated calls), so callers should
+    not modify them.
+
+    :param program: The program under test, which must be a deterministic function of its keyword arguments.
+    :param maxsize: The maximum number of input vectors to cache outputs for.
+    """
+
+    def __init__(self, program, maxsize: int = 65536):
+        self.program = program
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, **inputs):
+        key = tuple(sorted(inputs.items()))
+        outputs = self.cache.get(key)
+        if outputs is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return outputs
+
+        self.misses += 1
+        outputs = self.program(**inputs)
+        self.cache[key] = outputs
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return outputs
+
+    def __str__(self):
+        return f"{self.hits} hits, {self.misses} misses ({len(self.cache)}/{self.maxsize} cached)"
+
+
+class _ProgramVariants:
+    """A generated program together with variants of it that only execute some of its output blocks.
+
+    Calling the object executes the whole program.
+
+    :param source: The source code of the generated program.
+    :param program_name: The name of the function under test.
+    :param namespace: The global namespace in which to execute the program and its variants. Defaults to a new
+                      namespace.
+    """
+
+    def __init__(self, source: str, program_name: str = "program", namespace: dict = None):
+        self.module = ast.parse(source)
+        self.program_name = program_name
+        self.function = get_program_function(self.module, program_name)
+        self.output_blocks = get_output_blocks(self.function)
+        self.dependency_graph = get_program_dependency_graph(source, program_name)
+        self.namespace = {"__name__": "program.program"} if namespace is None else namespace
+        exec(compile(self.module, f"<{program_name}>", "exec"), self.namespace)
+        self.program = self.namespace[program_name]
+
+    def __call__(self, **inputs):
+        return self.program(**inputs)
+
+    def _compile_variant(self, variant_name: str, outputs: set, return_statement: ast.Return = None,
+                         prologue: list = (), positional_arguments: list = ()):
+        """Compile a variant of the program that only executes the blocks computing the given outputs.
+
+        :param variant_name: The name of the variant function.
+        :param outputs: The outputs whose blocks are kept (in their original order).
+        :param return_statement: The return statement of the variant. Defaults to that of the program.
+        :param prologue: Statements to execute before the kept blocks.
+        :param positional_arguments: Names of additional positional-only arguments taken by the variant.
+        :return: The variant, which takes the same arguments as the program (after any positional-only arguments).
+        """
+        excluded_blocks = {id(block) for name, block in self.output_blocks.items() if name not in outputs}
+        body = [statement for statement in self.function.body if id(statement) not in excluded_blocks]
+        if ast.get_docstring(self.function) is not None:
+            body = body[1:]
+        if return_statement is not None:
+            body = [statement for statement in body if not isinstance(statement, ast.Return)] + [return_statement]
+
+        variant_function = copy.copy(self.function)
+        variant_function.name = variant_name
+        variant_function.body = list(prologue) + body
+        if positional_arguments:
+            variant_function.args = copy.copy(self.function.args)
+            variant_function.args.posonlyargs = [ast.arg(name) for name in positional_arguments]
+        variant_module = ast.fix_missing_locations(ast.Module([variant_function], []))
+        exec(compile(variant_module, f"<{variant_name}>", "exec"), self.namespace)
+        return self.namespace[variant_name]
+
+
+class SlicedProgram(_ProgramVariants):
+    """Execute a generated program one output at a time, running only the statements that can influence that output.
+
+    The slice for an output contains the blocks that compute the output and its ancestors in the program's dependency
+    graph (its ancestor cone), in their original order. Each slice takes the same arguments as the program but only
+    returns the output it was sliced for. Slices are compiled on first use and cached per output.
+
+    Calling a SlicedProgram executes the whole program.
+
+    :param source: The source code of the generated program.
+    :param program_name: The name of the function under test.
+    :param namespace: The global namespace in which to execute the program and its slices. Defaults to a new namespace.
+    """
+
+    def __init__(self, source: str, program_name: str = "program", namespace: dict = None):
+        super().__init__(source, program_name, namespace)
+        self.slices = {}
+
+    def get_slice(self, output: str):
+        """Get the slice of the program that computes a given output.
+
+        :param output: The name of the output.
+        :return: A function that takes the same arguments as the program and returns a dictionary containing only the
+                 given output.
+        """
+        program_slice = self.slices.get(output)
+        if program_slice is None:
+            cone = nx.ancestors(self.dependency_graph, output) | {output}
+            return_statement = ast.parse(f"return {{{output!r}: {output}}}").body[0]
+            program_slice = self._compile_variant(f"{self.program_name}_{output}", cone, return_statement)
+            self.slices[output] = program_slice
+        return program_slice
+
+
+class IncrementalProgram(SlicedProgram):
+    """Execute the follow-up run of a metamorphic test incrementally from the outputs of its source run.
+
+    The source and follow-up runs of a test differ only in the value of the relation's input variable, so only the
+    descendants of that variable (in the program's dependency graph) need to be recomputed for the follow-up run. Every
+    other output is reused from the source run. Both runs are restricted to the slice of the program that computes the
+    relation's output: the source run returns every variable in the slice, and the follow-up run only recomputes the
+    outputs in the slice that descend from the input variable, reading the values of the other outputs they depend on
+    from the source run. Follow-up functions are compiled on first use and cached per input and output variable.
+
+    Calling an IncrementalProgram executes the whole program.
+
+    :param source: The source code of the generated program.
+    :param program_name: The name of the function under test.
+    :param namespace: The global namespace in which to execute the program. Defaults to a new namespace.
+    """
+
+    def __init__(self, source: str, program_name: str = "program", namespace: dict = None):
+        super().__init__(source, program_name, namespace)
+        self.follow_ups = {}
+
+    def get_slice(self, output: str):
+        """Get the slice of the program that computes a given output.
+
+        :param output: The name of the output.
+        :return: A function that takes the same arguments as the program and returns a dictionary of the values of all
+                 variables in the slice (i.e. the given output, its ancestors and the arguments of the program).
+        """
+        program_slice = self.slices.get(output)
+        if program_slice is None:
+            cone = nx.ancestors(self.dependency_graph, output) | {output}
+            return_statement = ast.parse("return locals()").body[0]
+            program_slice = self._compile_variant(f"{self.program_name}_{output}", cone, return_statement)
+            self.slices[output] = program_slice
+        return program_slice
+
+    def get_follow_up(self, variable: str, output: str):
+        """Get the follow-up function for relations that intervene on one variable and observe another.
+
+        :param variable: The input variable of the relation.
+        :param output: The output variable of the relation.
+        :return: A function that takes the outputs of the source run (as returned by the slice for the output), followed
+                 by the inputs of the follow-up run as keyword arguments, and returns the outputs of the follow-up run.
+        """
+        follow_up = self.follow_ups.get((variable, output))
+        if follow_up is None:
+            cone = nx.ancestors(self.dependency_graph, output) | {output}
+            descendants = nx.descendants(self.dependency_graph, variable) if variable in self.dependency_graph \
+                else set()
+            recomputed = cone & descendants
+            # Outputs that are read by a recomputed block (or returned) but are not recomputed themselves are reused
+            read = {parent for name in recomputed for parent in self.dependency_graph.predecessors(name)} | {output}
+            reused = sorted(name for name in read
+                            if name in self.output_blocks and name not in recomputed and name != variable)
+            prologue = [ast.parse(f"{name} = __source__[{name!r}]").body[0] for name in reused]
+            return_statement = ast.parse(f"return {{{output!r}: {output}}}").body[0]
+            follow_up = self._compile_variant(f"{self.program_name}_{variable}_{output}", recomputed, return_statement,
+                                              prologue, positional_arguments=["__source__"])
+            self.follow_ups[(variable, output)] = follow_up
+        return follow_up
@@ -5,7 +5,9 @@ import ast
 import mccabe as mc
 from dags.dag_generation import generate_dag
 from dags.dag_utils import sort_causal_dag_nodes, get_output_order
+from dags.dag_index import CausalDAGIndex
 from typing import Iterable
+from programs.program_vectorisation import write_vectorised_program
 from helpers import safe_open_w
 from time import time
 
@@ -26,6 +28,9 @@ def generate_program(
     :param target_directory_path: The path of the directory to which the program will be saved.
     :param program_name: The name the program will be saved as (excluding the .py extension).
     :param seed: The seed to fix the non-deterministic behaviour.
+
+    In addition to the program, a vectorised twin is saved as f"{program_name}_vectorised.py" (see
+    programs/program_vectorisation.py).
     """
     if seed is not None:
         random.seed(seed)
@@ -44,12 +49,13 @@ def generate_program(
     output_nodes = [node for node in causal_dag.nodes if "Y" in node]
 
     # Sort input and output nodes in ascending order
-    sorted_input_nodes = sort_causal_dag_nodes(input_nodes, False)
-    sorted_output_nodes = sort_causal_dag_nodes(output_nodes, False)
+    index = CausalDAGIndex(causal_dag)
+    sorted_input_nodes = sort_causal_dag_nodes(input_nodes, False, index)
+    sorted_output_nodes = sort_causal_dag_nodes(output_nodes, False, index)
 
     # Construct a series of statements (program) with the same causal structure as the DAG
     pg_start_time = time()
-    statement_stack = construct_statement_stack_from_dag(causal_dag)
+    statement_stack = construct_statement_stack_from_dag(causal_dag, index)
     pg_end_time = time()
     # print(f"Program Generation Time: {pg_end_time - pg_start_time}s")
 
@@ -67,13 +73,16 @@ def generate_program(
     # print(f"Format time: {format_end_time - format_start_time}s")
     program_path = os.path.join(target_directory_path, f"{program_name}.py")
 
+    # Write a vectorised twin of the program that evaluates many tests at once using NumPy arrays
+    write_vectorised_program(program_path)
+
     # Compute the McCabe complexity: we subtract number of outputs since each computation
     # has a superfluous if statement that allows us to directly intervene on output values
     # mccabe_complexity = get_mccabe_complexity(program_path) - len(output_nodes)
     # print(f"McCabe complexity: {mccabe_complexity}")
 
 
-def construct_statement_stack_from_dag(causal_dag: nx.DiGraph):
+def construct_statement_stack_from_dag(causal_dag: nx.DiGraph, index: CausalDAGIndex = None):
     """Construct a stack of statements for each output in the causal DAG, with the same causal structure.
 
     This function iterates over the outputs in the causal DAG and constructs linear arithmetic functions with the same
@@ -85,9 +94,10 @@ def construct_statement_stack_from_dag(causal_dag: nx.DiGraph):
 
     :param causal_dag: A networkx DiGraph representing a causal DAG from which the structure of the program will be
                        generated.
+    :param index: An optional CausalDAGIndex of the DAG, from which the order of the outputs is read.
     :return: A list of strings representing statements that can be executed in python.
     """
-    nodes_ordered_for_traversal = get_output_order(causal_dag)
+    nodes_ordered_for_traversal = get_output_order(causal_dag, index)
     nodes_ordered_for_traversal.reverse()
     statement_stack = []
 
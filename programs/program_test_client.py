@@ -0,0 +1,124 @@
+"""A minimal client that asks a running programs/program_test_server.py to test a program.
+
+This accepts the same arguments as programs/program_testing.py (plus the server address) and honours the same exit-code
+contract: with -c, it exits with an AssertionError if any metamorphic relation failed. It only imports the standard
+library and the connection settings it shares with the server (programs/program_test_connection.py) so that it starts
+quickly enough to be used as the cosmic-ray test-command.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing.connection import Client
+from programs.program_test_connection import get_authkey, parse_address
+
+
+def connect(address: str, timeout: float = 30.0):
+    """Connect to the server, retrying until it is ready to accept connections or the timeout expires."""
+    authkey = get_authkey()
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return Client(parse_address(address), authkey=authkey)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parses args"
+    )
+    parser.add_argument('-a',
+                        '--address',
+                        help="Address of the test server: host:port or the path to a unix socket.",
+                        required=True,
+                        )
+    parser.add_argument('-p',
+                        '--program',
+                        help="Path to program file.",
+                        required=False,
+                        )
+    parser.add_argument('-d',
+                        '--dag',
+                        help="Path to causal dag.",
+                        required=False,
+                        )
+    parser.add_argument('-s',
+                        '--seed',
+                        help="A random seed for reproducibility. Defaults to 0.",
+                        required=False,
+                        type=int,
+                        default=0)
+    parser.add_argument('-o',
+                        '--outfile',
+                        help="A location to save test results.",
+                        required=False,
+                        )
+    parser.add_argument('-c',
+                        '--continue',
+                        help="Flag to continue after first failure.",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        dest='continue_'
+                        )
+    parser.add_argument('-t',
+                        '--tests',
+                        help="Number of tests to generate per relation.",
+                        required=False,
+                        type=int,
+                        default=1)
+    parser.add_argument('-m',
+                        '--memoise',
+                        help="Cache the outputs of up to this many distinct program calls, shared across all relations.",
+                        required=False,
+                        type=int)
+    parser.add_argument('-sc',
+                        '--short-circuit',
+                        help="Stop executing the tests of each relation as soon as its oracle outcome is known.",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        dest='short_circuit'
+                        )
+    parser.add_argument('--shutdown',
+                        help="Shut down the test server instead of testing a program.",
+                        required=False,
+                        action='store_true'
+                        )
+    args = parser.parse_args()
+
+    if args.shutdown:
+        with connect(args.address) as connection:
+            connection.send(None)  # A None request shuts down the server
+        sys.exit(0)
+    if args.program is None or args.dag is None:
+        parser.error("the following arguments are required: -p/--program, -d/--dag")
+
+    with connect(args.address) as connection:
+        connection.send({
+            "program": os.path.abspath(args.program),
+            "dag": os.path.abspath(args.dag),
+            "seed": args.seed,
+            "tests": args.tests,
+            "memoise": args.memoise,
+            "short_circuit": args.short_circuit
+        })
+        response = connection.recv()
+
+    for message in response["log"]:
+        print(message)
+
+    if response["error"] is not None:
+        print(response["error"], file=sys.stderr)
+        sys.exit(2)
+
+    results = response["results"]
+    if args.outfile is not None:
+        with open(args.outfile, 'w') as f:
+            print(json.dumps(results), file=f)
+
+    if args.continue_:
+        failed_relations = [result["relation"] for result in results if result["failed"]]
+        assert not failed_relations, f"Failed MRs: {failed_relations}"
@@ -0,0 +1,37 @@
+"""The connection settings shared by programs/program_test_server.py and programs/program_test_client.py.
+
+The server unpickles the requests it receives, so it only accepts clients that know its authentication key. The key is
+generated for each run (run.sh does this) and passed to the server and its clients in the environment variable
+PROGRAM_TEST_SERVER_AUTHKEY, e.g.:
+
+    export PROGRAM_TEST_SERVER_AUTHKEY=$(python -c "import secrets; print(secrets.token_hex(32))")
+
+This only imports the standard library so that the client can import it without slowing its start-up.
+"""
+import os
+
+AUTHKEY_VARIABLE = "PROGRAM_TEST_SERVER_AUTHKEY"
+
+
+def get_authkey() -> bytes:
+    """Get the authentication key shared by the test server and its clients from the environment.
+
+    :return: The authentication key.
+    """
+    authkey = os.environ.get(AUTHKEY_VARIABLE)
+    if not authkey:
+        raise RuntimeError(f"{AUTHKEY_VARIABLE} must be set to a secret key shared by the test server and its "
+                           f"clients.")
+    return authkey.encode()
+
+
+def parse_address(address: str):
+    """Parse a server address, which is either host:port or the path to a unix socket.
+
+    :param address: The address string.
+    :return: An address that can be passed to multiprocessing.connection.Listener or Client.
+    """
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return host, int(port)
+    return address
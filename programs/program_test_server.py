@@ -0,0 +1,137 @@
+"""A long-lived server that tests (mutated) programs against a fixed set of metamorphic relations.
+
+Starting a fresh `python programs/program_testing.py` for every mutant re-imports pandas and networkx, re-parses the
+DAG, and regenerates every metamorphic relation and test. This server does all of that once and then tests each program
+it is sent by programs/program_test_client.py, which has the same command line interface and exit-code contract as
+program_testing.py.
+
+Example:
+    export PROGRAM_TEST_SERVER_AUTHKEY=$(python -c "import secrets; print(secrets.token_hex(32))")
+    python programs/program_test_server.py -a test_server.sock -d ../DAG.dot -t 1 &
+    python programs/program_test_client.py -a test_server.sock -p ./program.py -d ../DAG.dot -c -t 1
+    python programs/program_test_client.py -a test_server.sock --shutdown
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+from programs.program_execution import MemoisedProgram
+from programs.program_testing import load_program, iter_relations_with_tests, test_relations
+from programs.program_test_connection import get_authkey, parse_address
+from dags.dag_utils import load_dag
+
+
+def serve(address: str, dag_path: str, seed: int = 0, sample_size: int = 1):
+    """Generate the metamorphic relations and tests for a DAG once, then test every program sent by a client.
+
+    Each request is a dict with the keys "program", "dag", "seed", "tests", "memoise" and "short_circuit". The DAG,
+    seed, and number of tests must match those the server was started with. Each response is a dict with the keys
+    "results" (as written by program_testing.py), "log" (the messages program_testing.py would print), and "error"
+    (a traceback if the request could not be served, None otherwise).
+
+    :param address: The address to listen on (host:port or the path to a unix socket).
+    :param dag_path: Path to the causal DAG.
+    :param seed: A random seed for reproducibility.
+    :param sample_size: Number of tests to generate per relation.
+    """
+    # Close the listener (removing a unix socket) if the server is terminated rather than shut down
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+    authkey = get_authkey()
+    remove_stale_socket(address)
+
+    dag = load_dag(dag_path)
+    relations = list(iter_relations_with_tests(dag, seed=seed, sample_size=sample_size))
+    print(f"Generated {len(relations)} metamorphic relations with {sample_size} tests each.")
+
+    with Listener(parse_address(address), authkey=authkey) as listener:
+        print(f"Listening on {address}")
+        while True:
+            try:
+                with listener.accept() as connection:
+                    request = connection.recv()
+                    if request is None:
+                        break  # A None request shuts down the server
+                    connection.send(handle_request(request, relations, dag_path, seed, sample_size))
+            except (AuthenticationError, EOFError, OSError):
+                continue  # A client that fails to authenticate or disconnects (e.g. times out) is ignored
+
+
+def remove_stale_socket(address: str):
+    """Remove a unix socket left behind by a server that is no longer running, so that its address can be reused.
+
+    :param address: The address to listen on (host:port or the path to a unix socket).
+    """
+    socket_path = parse_address(address)
+    if not isinstance(socket_path, str) or not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX) as probe:
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            os.unlink(socket_path)
+            return
+    raise OSError(f"Another server is already listening on {address}.")
+
+
+def handle_request(request: dict, relations, dag_path: str, seed: int, sample_size: int) -> dict:
+    """Test the program named in a request against the server's metamorphic relations.
+
+    :param request: The request sent by the client.
+    :param relations: The metamorphic relations whose tests have been generated.
+    :param dag_path: Path to the causal DAG the server was started with.
+    :param seed: The random seed the server was started with.
+    :param sample_size: The number of tests per relation the server was started with.
+    :return: The response to send to the client.
+    """
+    log = []
+    try:
+        assert os.path.samefile(request["dag"], dag_path), f"Server was started for {dag_path}, not {request['dag']}."
+        assert (request["seed"], request["tests"]) == (seed, sample_size), \
+            f"Server was started with seed {seed} and {sample_size} tests, not seed {request['seed']} " \
+            f"and {request['tests']} tests."
+        program = load_program(request["program"])
+        if request["memoise"]:
+            program = MemoisedProgram(program, request["memoise"])
+        results, skipped_executions = test_relations(relations, program, short_circuit=request["short_circuit"],
+                                                     log=lambda message: log.append(str(message)))
+        if request["memoise"]:
+            log.append(f"Program call cache: {program}")
+        if request["short_circuit"]:
+            log.append(f"Short-circuiting skipped {skipped_executions} program executions.")
+        return {"results": results, "log": log, "error": None}
+    except Exception:
+        return {"results": None, "log": log, "error": traceback.format_exc()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parses args"
+    )
+    parser.add_argument('-a',
+                        '--address',
+                        help="Address to listen on: host:port or the path to a unix socket.",
+                        required=True,
+                        )
+    parser.add_argument('-d',
+                        '--dag',
+                        help="Path to causal dag.",
+                        required=True,
+                        )
+    parser.add_argument('-s',
+                        '--seed',
+                        help="A random seed for reproducibility. Defaults to 0.",
+                        required=False,
+                        type=int,
+                        default=0)
+    parser.add_argument('-t',
+                        '--tests',
+                        help="Number of tests to generate per relation.",
+                        required=False,
+                        type=int,
+                        default=1)
+    args = parser.parse_args()
+    serve(args.address, args.dag, seed=args.seed, sample_size=args.tests)
@@ -1,71 +1,164 @@
 import argparse
 import networkx as nx
-import importlib
 import json
 import os
-from metamorphic_relations.metamorphic_relation_generation import generate_metamorphic_relations
-
-parser = argparse.ArgumentParser(
-    description="Parses args"
-)
-parser.add_argument('-p',
-                    '--program',
-                    help="Path to program file.",
-                    required=True,
-                    )
-parser.add_argument('-d',
-                    '--dag',
-                    help="Path to causal dag.",
-                    required=True,
-                    )
-parser.add_argument('-s',
-                    '--seed',
-                    help="A random seed for reproducibility. Defaults to 0.",
-                    required=False,
-                    )
-parser.add_argument('-o',
-                    '--outfile',
-                    help="A location to save test results.",
-                    required=False,
-                    )
-parser.add_argument('-c',
-                    '--continue',
-                    help="Flag to continue after first failure.",
-                    required=False,
-                    action=argparse.BooleanOptionalAction,
-                    dest='continue_'
-                    )
-parser.add_argument('-t',
-                    '--tests',
-                    help="Number of tests to generate per relation.",
-                    required=False,
-                    type=int,
-                    default=1)
-args = parser.parse_args()
-program_path = args.program
-mod_spec = importlib.util.spec_from_file_location("program.program", program_path)
-program = importlib.util.module_from_spec(mod_spec)
-mod_spec.loader.exec_module(program)
-dag = nx.nx_pydot.read_dot(args.dag)
-sample_size = args.tests
-
-seed = 0
-if args.seed is not None:
-    seed = int(args.seed)
-
-results = []
-for relation in generate_metamorphic_relations(dag):
-    result = {"relation": str(relation), "total": 0, "failed": False}
-    relation.generate_tests(seed=seed, sample_size=sample_size)
-    result["total"] += len(relation.tests)
-    failures = relation.execute_tests(program.program)
+from metamorphic_relations.metamorphic_relation_generation import iter_metamorphic_relations
+from metamorphic_relations.metamorphic_relation import InputDomains
+from metamorphic_relations.test_suite import load_test_suite
+from metamorphic_relations.execution_plan import ExecutionPlan
+from programs.program_analysis import get_program_dependency_graph, get_affected_outputs, SymbolicAnalyser
+from programs.program_execution import MemoisedProgram, SlicedProgram, IncrementalProgram
+from dags.dag_utils import load_dag
+
+
+def load_program(program_path, program_name="program"):
+    """Load the program under test from a python file.
+
+    The source is compiled directly (rather than imported) so that a program that has been modified in place, e.g. by
+    cosmic-ray, is never served from a stale bytecode cache.
+
+    :param program_path: Path to the program file.
+    :param program_name: Name of the function under test within the program file.
+    :return: The program under test as a callable.
+    """
+    with open(program_path) as program_file:
+        program_source = program_file.read()
+    namespace = {"__name__": "program.program", "__file__": program_path}
+    exec(compile(program_source, program_path, "exec"), namespace)
+    return namespace[program_name]
+
+
+def iter_relations_with_tests(dag: nx.DiGraph, seed: int = 0, sample_size: int = 1, domains: InputDomains = None,
+                              independent_streams: bool = False):
+    """Lazily generate the metamorphic relations implied by a DAG, generating the tests of each relation.
+
+    :param dag: A networkx directed graph representing a causal DAG.
+    :param seed: A random seed for reproducibility.
+    :param sample_size: Number of tests to generate per relation.
+    :param domains: The domains of the variables (see InputDomains). Defaults to [-10, 10] for every variable.
+    :param independent_streams: Whether each relation draws its tests from its own random stream (see
+                                CausalMetamorphicRelation.random_generator).
+    :return: A generator of metamorphic relations whose tests have been generated.
+    """
+    for relation in iter_metamorphic_relations(dag):
+        relation.generate_tests(seed=seed, sample_size=sample_size, domains=domains,
+                                independent_streams=independent_streams)
+        yield relation
+
+
+def test_relations(relations, program, short_circuit: bool = False, log=print, analyser: SymbolicAnalyser = None):
+    """Execute the tests of each metamorphic relation against a program and apply the relation's oracle.
+
+    :param relations: An iterable of metamorphic relations whose tests have been generated.
+    :param program: The program under test. If this is a SlicedProgram, each relation only executes the slice of the
+                    program that computes its output. If this is an IncrementalProgram, each follow-up run also
+                    only recomputes the outputs in this slice that descend from the relation's input variable.
+    :param short_circuit: Whether to stop executing the tests of each relation once its oracle outcome is known.
+    :param log: A function used to report failed relations.
+    :param analyser: An optional SymbolicAnalyser for the program. Relations whose verdict it can decide are not
+                     executed.
+    :return: A list of results (one dict per relation) and the number of program executions skipped by short-circuiting.
+    """
+    results = []
+    skipped_executions = 0
+    for relation in relations:
+        output_changes = None
+        if analyser is not None:
+            output_changes = analyser.output_changes(relation.input_var, relation.output_var, relation.adjustment_list)
+        if output_changes is not None:
+            # Every test has the same outcome, so the relation is decided without executing the program
+            failures = [] if relation.assertion(0, int(output_changes), None) else [{}] * len(relation.tests)
+        else:
+            relation_program = program.get_slice(relation.output_var) if isinstance(program, SlicedProgram) \
+                else program
+            follow_up_program = None
+            if isinstance(program, IncrementalProgram):
+                follow_up_program = program.get_follow_up(relation.input_var, relation.output_var)
+            failures = relation.execute_tests(relation_program, short_circuit=short_circuit,
+                                              follow_up_program=follow_up_program)
+            skipped_executions += 2 * relation.skipped_tests  # Each test comprises a source and a follow-up execution
+        results.append(apply_oracle(relation, failures, log))
+    return results, skipped_executions
+
+
+def test_execution_plan(execution_plan: ExecutionPlan, program, short_circuit: bool = False, log=print):
+    """Execute the tests of the metamorphic relations in an execution plan against a program and apply their oracles.
+
+    :param execution_plan: An ExecutionPlan for the relations, which shares program calls between relations with the
+                           same input variable and fixed variables.
+    :param program: The program under test.
+    :param short_circuit: Whether to stop executing the tests of each group of relations once their oracle outcomes
+                          are known.
+    :param log: A function used to report failed relations.
+    :return: A list of results (one dict per relation) and the number of program executions skipped by short-circuiting.
+    """
+    failures, skipped_executions = execution_plan.execute(program, short_circuit=short_circuit)
+    results = [apply_oracle(relation, relation_failures, log)
+               for relation, relation_failures in zip(execution_plan.relations, failures)]
+    return results, skipped_executions
+
+
+def apply_oracle(relation, failures, log=print):
+    """Apply the oracle of a metamorphic relation to the failures of its tests.
+
+    :param relation: A metamorphic relation whose tests have been executed.
+    :param failures: The failures returned by executing the relation's tests.
+    :param log: A function used to report failed relations.
+    :return: The result of the relation, as a dict.
+    """
+    result = {"relation": str(relation), "total": len(relation.tests), "failed": False}
     try:
         relation.oracle(failures)
     except AssertionError as e:
-        print(e)
+        log(e)
         # Only add failures that result in MR failing (i.e. if all tests fail for --> and if one test fails for _||_)
         result["failed"] = True
-    results.append(result)
+    return result
+
+
+def test_affected_relations(relations, program, affected_outputs, baseline_results: dict, seed: int = 0,
+                            sample_size: int = 1, short_circuit: bool = False, log=print,
+                            analyser: SymbolicAnalyser = None, domains: InputDomains = None,
+                            independent_streams: bool = False):
+    """Test only the metamorphic relations whose verdict can be changed by a mutation, reusing the baseline verdicts of
+    the rest.
+
+    A mutation that adds or deletes the edge cause --> effect can only change the outputs in affected_outputs (see
+    programs.program_analysis.get_affected_outputs), so only relations that observe one of these outputs are tested.
+    Tests are generated for these relations if they have not been already.
+
+    :param relations: An iterable of metamorphic relations.
+    :param program: The (mutated) program under test.
+    :param affected_outputs: The outputs whose values can be changed by the mutation.
+    :param baseline_results: A dictionary mapping relation strings to the results of testing the original program.
+    :param seed: A random seed for reproducibility.
+    :param sample_size: Number of tests to generate per relation.
+    :param short_circuit: Whether to stop executing the tests of each relation once its oracle outcome is known.
+    :param log: A function used to report failed relations.
+    :param analyser: An optional SymbolicAnalyser for the program (see test_relations).
+    :param domains: The domains of the variables (see InputDomains). Defaults to [-10, 10] for every variable.
+    :param independent_streams: Whether each relation draws its tests from its own random stream (see
+                                CausalMetamorphicRelation.random_generator).
+    :return: A list of results (one dict per relation), the number of program executions skipped by short-circuiting,
+             and the number of relations whose baseline results were reused.
+    """
+    results = []
+    skipped_executions = 0
+    reused_relations = 0
+    for relation in relations:
+        baseline_result = baseline_results.get(str(relation))
+        if relation.output_var not in affected_outputs and baseline_result is not None:
+            results.append(dict(baseline_result))
+            reused_relations += 1
+            continue
+        if relation.tests is None:
+            relation.generate_tests(seed=seed, sample_size=sample_size, domains=domains,
+                                    independent_streams=independent_streams)
+        relation_results, relation_skipped_executions = test_relations([relation], program, short_circuit, log,
+                                                                       analyser)
+        results.extend(relation_results)
+        skipped_executions += relation_skipped_executions
+    return results, skipped_executions, reused_relations
 
 
 def get_failures(results_dict):
@@ -76,10 +169,196 @@ def get_failures(results_dict):
     return failed_relations
 
 
-if args.outfile is not None:
-    with open(args.outfile, 'w') as f:
-        print(json.dumps(results), file=f)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parses args"
+    )
+    parser.add_argument('-p',
+                        '--program',
+                        help="Path to program file.",
+                        required=True,
+                        )
+    parser.add_argument('-d',
+                        '--dag',
+                        help="Path to causal dag.",
+                        required=True,
+                        )
+    parser.add_argument('-s',
+                        '--seed',
+                        help="A random seed for reproducibility. Defaults to 0.",
+                        required=False,
+                        )
+    parser.add_argument('-o',
+                        '--outfile',
+                        help="A location to save test results.",
+                        required=False,
+                        )
+    parser.add_argument('-c',
+                        '--continue',
+                        help="Flag to continue after first failure.",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        dest='continue_'
+                        )
+    parser.add_argument('-t',
+                        '--tests',
+                        help="Number of tests to generate per relation.",
+                        required=False,
+                        type=int,
+                        default=1)
+    parser.add_argument('-m',
+                        '--memoise',
+                        help="Cache the outputs of up to this many distinct program calls, shared across all relations.",
+                        required=False,
+                        type=int)
+    parser.add_argument('-sc',
+                        '--short-circuit',
+                        help="Stop executing the tests of each relation as soon as its oracle outcome is known.",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        dest='short_circuit'
+                        )
+    parser.add_argument('--domains',
+                        help="Path to a JSON file of variable domains, e.g. "
+                             "{\"default\": [-10, 10], \"variables\": {\"X1\": [0, 100]}}. Defaults to [-10, 10] "
+                             "for every variable.",
+                        required=False,
+                        )
+    parser.add_argument('--independent-streams',
+                        help="Draw the tests of each relation from its own random stream, rather than reseeding the "
+                             "same stream for every relation.",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        dest='independent_streams'
+                        )
+    parser.add_argument('--suite',
+                        help="Path to a precompiled test suite (.npz) for the DAG, seed and number of tests. The suite "
+                             "is built if it does not exist and rebuilt if it is stale.",
+                        required=False,
+                        )
+    parser.add_argument('--slice',
+                        help="Execute only the slice of the program that computes the output of each relation.",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        )
+    parser.add_argument('--incremental',
+                        help="Only recompute the descendants of each relation's input variable in follow-up runs. "
+                             "This also slices the program (see --slice).",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        )
+    parser.add_argument('--symbolic',
+                        help="Decide the verdicts of relations from the program's linear expressions where possible, "
+                             "only executing the tests of the other relations.",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        )
+    parser.add_argument('--fused',
+                        help="Execute the tests of relations with the same input variable and fixed outputs together, "
+                             "checking all of their outputs against the same pair of program calls.",
+                        required=False,
+                        action=argparse.BooleanOptionalAction,
+                        )
+    parser.add_argument('-me',
+                        '--mutation-effect',
+                        help="The effect_variable of the mutation applied to the program. If given (with --baseline), "
+                             "only relations whose output can be affected by the mutation are tested.",
+                        required=False,
+                        )
+    parser.add_argument('-b',
+                        '--baseline',
+                        help="Path to the results (-o) of testing the original program, whose verdicts are reused for "
+                             "relations that cannot be affected by the mutation.",
+                        required=False,
+                        )
+    args = parser.parse_args()
+    assert sum(map(bool, (args.slice, args.incremental, args.memoise))) <= 1, \
+        "Only one of slicing (--slice), incremental execution (--incremental) and memoisation (--memoise) can be used."
+    assert not args.fused or not any((args.slice, args.incremental, args.symbolic, args.suite, args.mutation_effect)), \
+        "Fused execution (--fused) cannot be combined with --slice, --incremental, --symbolic, --suite or " \
+        "--mutation-effect."
+    with open(args.program) as program_file:
+        program_source = program_file.read()
+    if args.slice:
+        program = SlicedProgram(program_source)
+    elif args.incremental:
+        program = IncrementalProgram(program_source)
+    else:
+        program = load_program(args.program)
+    domains = InputDomains.from_json(args.domains) if args.domains is not None else None
+    analyser = SymbolicAnalyser(program_source, domains=domains) if args.symbolic else None
+    sample_size = args.tests
+    independent_streams = bool(args.independent_streams)
+
+    seed = 0
+    if args.seed is not None:
+        seed = int(args.seed)
+
+    program_under_test = program
+    if args.memoise:
+        program_under_test = MemoisedProgram(program, args.memoise)
+
+    if args.suite is not None:
+        test_suite = load_test_suite(args.dag, args.suite, seed=seed, sample_size=sample_size,
+                                     domains=domains, independent_streams=independent_streams)
+        test_suite.assign_tests()
+        relations = test_suite.relations
+    elif args.mutation_effect is not None or args.fused:
+        # Tests are only generated for the relations that are selected for testing, or once per group when fused
+        relations = iter_metamorphic_relations(load_dag(args.dag))
+    else:
+        relations = iter_relations_with_tests(load_dag(args.dag), seed=seed, sample_size=sample_size,
+                                              domains=domains, independent_streams=independent_streams)
+
+    if args.mutation_effect is not None:
+        assert args.baseline is not None, "Test selection (--mutation-effect) requires baseline results (--baseline)."
+        affected_outputs = get_affected_outputs(get_program_dependency_graph(program_source), args.mutation_effect)
+        with open(args.baseline) as baseline_file:
+            baseline_results = {result["relation"]: result for result in json.load(baseline_file)}
+        results, skipped_executions, reused_relations = test_affected_relations(
+            relations,
+            program_under_test,
+            affected_outputs,
+            baseline_results,
+            seed=seed,
+            sample_size=sample_size,
+            short_circuit=args.short_circuit,
+            analyser=analyser,
+            domains=domains,
+            independent_streams=independent_streams
+        )
+        print(f"Test selection reused the baseline results of {reused_relations} relations.")
+    elif args.fused:
+        execution_plan = ExecutionPlan(relations, sample_size=sample_size, seed=seed, domains=domains,
+                                       independent_streams=independent_streams)
+        results, skipped_executions = test_execution_plan(
+            execution_plan,
+            program_under_test,
+            short_circuit=args.short_circuit
+        )
+        print(f"Fused execution tested {len(execution_plan.relations)} relations in {len(execution_plan.groups)} "
+              f"groups, making {execution_plan.executions} program calls.")
+    else:
+        results, skipped_executions = test_relations(
+            relations,
+            program_under_test,
+            short_circuit=args.short_circuit,
+            analyser=analyser
+        )
+
+    if args.memoise:
+        print(f"Program call cache: {program_under_test}")
+
+    if args.short_circuit:
+        print(f"Short-circuiting skipped {skipped_executions} program executions.")
+
+    if args.symbolic:
+        print(f"Decided {analyser.decided} relations symbolically and {analyser.undecided} by execution.")
+
+    if args.outfile is not None:
+        with open(args.outfile, 'w') as f:
+            print(json.dumps(results), file=f)
 
-if args.continue_:
-    assert all([not result['failed'] for result in results]),\
-        f"Failed MRs: {get_failures(results)}"
+    if args.continue_:
+        assert all([not result['failed'] for result in results]),\
+            f"Failed MRs: {get_failures(results)}"
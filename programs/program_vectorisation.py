@@ -0,0 +1,258 @@
+"""Functions for converting generated programs into vectorised NumPy programs."""
+import ast
+import copy
+import os
+from helpers import safe_open_w
+
+# Defined in every vectorised program to detect values that would overflow int64
+INTEGER_HELPERS_SOURCE = '''
+OVERFLOW_THRESHOLD = 2.0 ** 62
+
+
+def _magnitude(value):
+    value = np.ma.getdata(value)
+    if np.asarray(value).dtype == object:
+        return 0.0
+    return np.abs(np.asarray(value, dtype=float))
+
+
+def _largest(*bounds):
+    return max(float(np.max(bound, initial=0.0)) for bound in bounds)
+
+
+def _to_integers(value, exact):
+    if value is None:
+        return None
+    return np.asanyarray(value).astype(object if exact else np.int64)
+'''
+
+
+def vectorise_program_source(source: str, program_name: str = "program") -> str:
+    """Convert the source code of a generated program to a vectorised twin that operates on NumPy arrays.
+
+    The twin has the same signature as the original program, but every argument may be a NumPy array. Outputs may
+    additionally be None (never intervened upon, as in the original program) or a masked array, in which case the
+    output is intervened upon in the unmasked entries only and computed by the program in the masked entries. This
+    allows tests that intervene on different outputs to be evaluated in the same call.
+
+    Each if-else statement produced by generate_predicate and generate_if_else_body is replaced by an assignment whose
+    value is selected with np.where, and each `if Y is None:` guard gains an else branch that merges the intervened
+    and computed values. Every output is returned as an array with the broadcast shape of the arguments.
+
+    The twin must compute exactly the same values as the original program, which uses unbounded Python ints, whereas
+    the outputs of deep DAGs can exceed 2**63 and would silently wrap in int64, changing both the branches taken and the
+    outputs. The twin therefore first evaluates the program with int64 arrays, bounding the magnitude of every value and
+    intermediate result of each statement in every row from the magnitudes of its operands (see _get_bound). If any
+    bound comes close to 2**63, the program is evaluated again with arrays of Python ints (dtype=object), which are
+    slower but cannot overflow.
+
+    Example: `if X1 >= 4: Y1 = (2 * X1) + 1 else: Y1 = 3` ==> `Y1 = np.where(X1 >= 4, (2 * X1) + 1, 3)`.
+
+    :param source: The source code of a program written by write_statement_stack_to_python_file (or a mutant thereof).
+    :param program_name: The name of the function to vectorise.
+    :return: The source code of a module defining the function f"{program_name}_vectorised".
+    """
+    module = ast.parse(source)
+    function = next(node for node in module.body if isinstance(node, ast.FunctionDef) and node.name == program_name)
+    function.name = f"{program_name}_vectorised"
+    arguments = [argument.arg for argument in function.args.args]
+
+    docstring = [statement for statement in function.body[:1] if _is_docstring(statement)]
+    body = function.body[len(docstring):]
+    return_statement = body.pop()
+    assert isinstance(return_statement, ast.Return) and isinstance(return_statement.value, ast.Dict), \
+        f"Expected {program_name} to end by returning a dict of outputs."
+
+    # Compute the broadcast shape of all arguments that are provided
+    shape_statement = ast.parse(
+        f"__shape__ = np.broadcast_shapes(*[np.shape(v) for v in ({', '.join(arguments)},) if v is not None])"
+    ).body[0]
+    statements = []
+    for statement in body:
+        bounds = _get_statement_bounds(statement)
+        statements += _vectorise_statements([statement])
+        statements.append(ast.parse(f"__largest__ = max(__largest__, _largest({', '.join(bounds)}))").body[0])
+
+    # The evaluation, which also returns the largest bound, is wrapped by a function with the original signature
+    evaluation = copy.deepcopy(function)
+    evaluation.name = f"_{program_name}_vectorised"
+    return_statement.value = ast.Tuple(elts=[return_statement.value, ast.Name("__largest__", ast.Load())],
+                                       ctx=ast.Load())
+    evaluation.body = [
+        shape_statement,
+        ast.parse(f"__largest__ = _largest({', '.join(f'_magnitude({argument})' for argument in arguments)})").body[0]
+    ] + statements + [return_statement]
+
+    call_arguments = ", ".join(f"{argument}=_to_integers({argument}, {{exact}})" for argument in arguments)
+    function.body = docstring + ast.parse(
+        f"outputs, largest = {evaluation.name}({call_arguments.format(exact=False)})\n"
+        f"if largest >= OVERFLOW_THRESHOLD:\n"
+        f"    outputs, _ = {evaluation.name}({call_arguments.format(exact=True)})\n"
+        f"return outputs\n"
+    ).body
+
+    vectorised_module = ast.Module(
+        body=[ast.Import(names=[ast.alias(name="numpy", asname="np")])] + ast.parse(INTEGER_HELPERS_SOURCE).body
+        + [evaluation, function],
+        type_ignores=[]
+    )
+    return ast.unparse(ast.fix_missing_locations(vectorised_module)) + "\n"
+
+
+def write_vectorised_program(program_path: str):
+    """Write the vectorised twin of a generated program next to it, suffixing its name with _vectorised.
+
+    :param program_path: The path to the generated program.
+    :return: The path to the vectorised program.
+    """
+    program_name = os.path.basename(program_path)[:-3]
+    with open(program_path) as program_file:
+        vectorised_source = vectorise_program_source(program_file.read(), program_name)
+    vectorised_program_path = os.path.join(os.path.dirname(program_path), f"{program_name}_vectorised.py")
+    with safe_open_w(vectorised_program_path) as vectorised_program_file:
+        vectorised_program_file.write(vectorised_source)
+    return vectorised_program_path
+
+
+def load_vectorised_program(program_path: str, program_name: str = None):
+    """Load the vectorised twin of a generated program directly from the program's source code.
+
+    Vectorising at load time, rather than loading a previously written twin, ensures that the twin reflects the
+    program as it currently is (e.g. after cosmic-ray has applied a mutation).
+
+    :param program_path: The path to the generated program.
+    :param program_name: The name of the function to vectorise. Defaults to the name of the file.
+    :return: The vectorised program as a callable.
+    """
+    if program_name is None:
+        program_name = os.path.basename(program_path)[:-3]
+    with open(program_path) as program_file:
+        vectorised_source = vectorise_program_source(program_file.read(), program_name)
+    namespace = {}
+    exec(compile(vectorised_source, f"{program_path}:vectorised", "exec"), namespace)
+    return namespace[f"{program_name}_vectorised"]
+
+
+def _get_statement_bounds(statement: ast.stmt) -> list:
+    """Get expressions that bound the magnitude of every value computed by a statement, in each row."""
+    if isinstance(statement, ast.If):
+        bounds = [] if _is_none_check(statement.test) else _get_predicate_bounds(statement.test)
+        for branch_statement in statement.body + statement.orelse:
+            bounds += _get_statement_bounds(branch_statement)
+        return bounds
+    if isinstance(statement, ast.Assign):
+        return [_get_bound(statement.value)]
+    return ["np.inf"]
+
+
+def _get_predicate_bounds(predicate: ast.expr) -> list:
+    """Get the bounds of the operands of every comparison in a predicate."""
+    if isinstance(predicate, ast.BoolOp):
+        return [bound for value in predicate.values for bound in _get_predicate_bounds(value)]
+    if isinstance(predicate, ast.UnaryOp) and isinstance(predicate.op, ast.Not):
+        return _get_predicate_bounds(predicate.operand)
+    if isinstance(predicate, ast.Compare):
+        return [_get_bound(operand) for operand in [predicate.left] + predicate.comparators]
+    return [_get_bound(predicate)]
+
+
+def _get_bound(expression: ast.expr) -> str:
+    """Get an expression that bounds the magnitude of an arithmetic expression and all of its subexpressions, in each
+    row, from the magnitudes of its variables.
+
+    Products are bounded by the product of the bounds of their factors, each rounded up to at least 1, so that the bound
+    of every expression is at least the bound of its subexpressions. Any other kind of expression is unbounded.
+    """
+    if isinstance(expression, ast.Name):
+        return f"_magnitude({expression.id})"
+    if isinstance(expression, ast.Constant) and isinstance(expression.value, int) \
+            and not isinstance(expression.value, bool):
+        return f"{float(abs(expression.value))!r}"
+    if isinstance(expression, ast.UnaryOp) and isinstance(expression.op, (ast.USub, ast.UAdd)):
+        return _get_bound(expression.operand)
+    if isinstance(expression, ast.BinOp) and isinstance(expression.op, (ast.Add, ast.Sub)):
+        return f"({_get_bound(expression.left)} + {_get_bound(expression.right)})"
+    if isinstance(expression, ast.BinOp) and isinstance(expression.op, ast.Mult):
+        factors = [_get_bound(expression.left), _get_bound(expression.right)]
+        factors = [repr(max(float(factor), 1.0)) if factor.replace(".", "").isdigit() else f"np.maximum({factor}, 1.0)"
+                   for factor in factors]
+        return f"({factors[0]} * {factors[1]})"
+    return "np.inf"
+
+
+def _vectorise_statements(statements):
+    """Vectorise a list of statements, keeping `if Y is None:` guards and replacing other if-else statements."""
+    vectorised_statements = []
+    for statement in statements:
+        if isinstance(statement, ast.If) and _is_none_check(statement.test) and not statement.orelse:
+            statement.body = _vectorise_statements(statement.body)
+            statement.orelse = _vectorise_intervention(statement)
+            vectorised_statements.append(statement)
+        elif isinstance(statement, ast.If):
+            vectorised_statements.append(_vectorise_if_else(statement))
+        elif isinstance(statement, ast.Assign):
+            vectorised_statements.append(statement)
+        else:
+            raise ValueError(f"Cannot vectorise statement: {ast.unparse(statement)}")
+    return vectorised_statements
+
+
+def _vectorise_intervention(statement: ast.If):
+    """Build the else branch of a vectorised `if Y is None:` guard, which only intervenes on unmasked entries of Y."""
+    if len(statement.body) != 1 or _assigned_name(statement.body[0]) != statement.test.left.id:
+        raise ValueError(f"Cannot vectorise if statement: {ast.unparse(statement)}")
+    output = statement.test.left.id
+    merge = ast.parse(f"{output} = np.where(np.ma.getmaskarray({output}), None, np.ma.getdata({output}))").body[0]
+    merge.value.args[1] = statement.body[0].value
+    return [merge]
+
+
+def _vectorise_if_else(statement: ast.If) -> ast.Assign:
+    """Replace an if-else statement whose branches each assign to the same variable with a single np.where."""
+    if_body = _vectorise_statements(statement.body)
+    else_body = _vectorise_statements(statement.orelse)
+    if not (len(if_body) == 1 and len(else_body) == 1 and _assigned_name(if_body[0]) is not None
+            and _assigned_name(if_body[0]) == _assigned_name(else_body[0])):
+        raise ValueError(f"Cannot vectorise if statement: {ast.unparse(statement)}")
+    target = if_body[0].targets[0]
+    where_call = ast.Call(
+        func=ast.parse("np.where", mode="eval").body,
+        args=[_vectorise_predicate(statement.test), if_body[0].value, else_body[0].value],
+        keywords=[]
+    )
+    return ast.Assign(targets=[target], value=where_call)
+
+
+def _vectorise_predicate(predicate: ast.expr) -> ast.expr:
+    """Replace boolean operators, which do not act elementwise, with their NumPy equivalents."""
+    if isinstance(predicate, ast.BoolOp):
+        function = "np.logical_and.reduce" if isinstance(predicate.op, ast.And) else "np.logical_or.reduce"
+        return ast.Call(
+            func=ast.parse(function, mode="eval").body,
+            args=[ast.List(elts=[_vectorise_predicate(value) for value in predicate.values], ctx=ast.Load())],
+            keywords=[]
+        )
+    if isinstance(predicate, ast.UnaryOp) and isinstance(predicate.op, ast.Not):
+        return ast.Call(func=ast.parse("np.logical_not", mode="eval").body,
+                        args=[_vectorise_predicate(predicate.operand)], keywords=[])
+    return predicate
+
+
+def _assigned_name(statement: ast.stmt):
+    """Get the name assigned by a single-target assignment, or None for any other statement."""
+    if isinstance(statement, ast.Assign) and len(statement.targets) == 1 and isinstance(statement.targets[0], ast.Name):
+        return statement.targets[0].id
+    return None
+
+
+def _is_none_check(test: ast.expr) -> bool:
+    """Check whether an expression has the form `Y is None`."""
+    return (isinstance(test, ast.Compare) and isinstance(test.left, ast.Name) and len(test.ops) == 1
+            and isinstance(test.ops[0], ast.Is)
+            and isinstance(test.comparators[0], ast.Constant) and test.comparators[0].value is None)
+
+
+def _is_docstring(statement: ast.stmt) -> bool:
+    """Check whether a statement is a docstring."""
+    return (isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant)
+            and isinstance(statement.value.value, str))
@@ -7,7 +7,30 @@ cp ../../program.py "./t${2}/program.py"
 cd "t${2}"
 #rm *.sqlite report.html *.json
 sed -i '' -e "s/-t.*/-t $2\"/" mutation_config.toml
+
+# Start a persistent test server if the test-command is a client of one
+server_address=$(grep -o "program_test_client.py -a [^ ]*" mutation_config.toml | cut -d " " -f 3)
+if [ -n "$server_address" ]; then
+  # The server only accepts clients that know this run's key, which the test-command inherits from the environment
+  export PROGRAM_TEST_SERVER_AUTHKEY=$(python -c "import secrets; print(secrets.token_hex(32))")
+  python ../../../../../../programs/program_test_server.py -a "$server_address" -d ../DAG.dot -t $2 &
+  server_pid=$!
+fi
+
 cosmic-ray init ./mutation_config.toml mutation_config.sqlite
-cosmic-ray --verbosity=INFO baseline ./mutation_config.toml
-cosmic-ray exec ./mutation_config.toml mutation_config.sqlite
+# The pool distributor is not a cosmic-ray plugin, so the baseline is run with a copy of the config that uses the local
+# distributor, and the jobs are executed by our own script
+if grep -q 'name = "pool"' mutation_config.toml; then
+  sed -e 's/name = "pool"/name = "local"/' mutation_config.toml > baseline_config.toml
+  cosmic-ray --verbosity=INFO baseline ./baseline_config.toml
+  python ../../../../../../mutation_testing/pool_distributor.py ./mutation_config.toml mutation_config.sqlite
+else
+  cosmic-ray --verbosity=INFO baseline ./mutation_config.toml
+  cosmic-ray exec ./mutation_config.toml mutation_config.sqlite
+fi
+
+if [ -n "$server_address" ]; then
+  python ../../../../../../programs/program_test_client.py -a "$server_address" --shutdown
+  wait $server_pid
+fi
 python ../../../../../../result_cleanup.py -r . -db mutation_config.sqlite -o results.json
@@ -0,0 +1,41 @@
+"""Tests for the vectorised twins of generated programs (programs/program_vectorisation.py)."""
+import importlib.util
+import numpy as np
+from dags.dag_generation import generate_dag
+from programs.program_generation import generate_program
+from programs.program_vectorisation import load_vectorised_program
+from metamorphic_relations.metamorphic_relation_generation import generate_metamorphic_relations
+from metamorphic_relations import test_suite
+
+
+def load_program(program_path):
+    mod_spec = importlib.util.spec_from_file_location("program", program_path)
+    program = importlib.util.module_from_spec(mod_spec)
+    mod_spec.loader.exec_module(program)
+    return program.program
+
+
+def test_twin_matches_program_on_deep_dag(tmp_path):
+    # The outputs of this DAG exceed the range of int64
+    dag = generate_dag(60, 0.3, 0.0, seed=0)
+    generate_program(dag, 0.0, str(tmp_path), "program", seed=0)
+    program = load_program(str(tmp_path / "program.py"))
+    vectorised_program = load_vectorised_program(str(tmp_path / "program.py"))
+
+    inputs = [node for node in dag.nodes if "X" in node]
+    input_values = np.random.RandomState(0).randint(-10, 11, size=(50, len(inputs)))
+    vectorised_outputs = vectorised_program(**dict(zip(inputs, input_values.T)))
+    largest_output = 0
+    for row, values in enumerate(input_values.tolist()):
+        outputs = program(**dict(zip(inputs, values)))
+        assert outputs == {output: vectorised_outputs[output].item(row) for output in outputs}
+        largest_output = max(largest_output, *(abs(value) for value in outputs.values()))
+    assert largest_output >= 2 ** 63
+
+
+def test_execute_vectorised_matches_execute_on_deep_dag(tmp_path):
+    dag = generate_dag(60, 0.3, 0.0, seed=0)
+    generate_program(dag, 0.0, str(tmp_path), "program", seed=0)
+    suite = test_suite.TestSuite.generate(generate_metamorphic_relations(dag), sample_size=5, seed=0)
+    failures = suite.execute(load_program(str(tmp_path / "program.py")))
+    assert suite.execute_vectorised(load_vectorised_program(str(tmp_path / "program.py"))) == failures